@@ -0,0 +1,63 @@
+import numpy as np
+import argparse
+import time
+import genstego
+import multires
+
+from PIL import Image
+
+def time_to_quality(logbook, elapsed, target):
+    """Estimated seconds until the max fitness of the logbook reaches target,
+    assuming every generation takes the same time. None if never reached."""
+    fit_max = np.maximum.accumulate(logbook.select('max'))
+    reached = np.flatnonzero(fit_max >= target)
+    if len(reached) == 0:
+        return None
+
+    return elapsed * (reached[0] + 1) / len(fit_max)
+
+ap = argparse.ArgumentParser()
+
+ap.add_argument('-ht', '--hosts', nargs='+',
+                default=['img/airplane.ppm', 'img/baboon.ppm', 'img/lenna.ppm',
+                         'img/pepper.ppm'])
+ap.add_argument('-s', '--secret', default='img/grumpy-115.png')
+ap.add_argument('-g', '--generations', default=40, type=int)
+ap.add_argument('-p', '--population', default=60, type=int)
+ap.add_argument('-f', '--factor', type=int)
+ap.add_argument('-b', '--budget', default=50, type=int)
+ap.add_argument('--seed', default=0, type=int)
+
+args = vars(ap.parse_args())
+
+secret = np.array(Image.open(args['secret']).convert('L'))
+
+print('{:20} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+    'host', 'flat_s', 'flat', 'multi_s', 'multi', 'ttq_s'))
+
+for path in args['hosts']:
+    host = np.array(Image.open(path).convert('L'))
+
+    start = time.time()
+    _, logbook, hof = genstego.evolve(host, [secret], args['generations'],
+                                      args['population'], seed=args['seed'],
+                                      verbose=False)
+    flat_time = time.time() - start
+    flat_fit = hof.items[0].fitness.values[0]
+
+    start = time.time()
+    _, _, mhof = multires.evolve_multires(host, secret, args['factor'],
+                                          args['generations'],
+                                          args['population'],
+                                          seed=args['seed'],
+                                          budget=args['budget'],
+                                          verbose=False)
+    multi_time = time.time() - start
+    multi_fit = mhof.items[0].fitness.values[0]
+
+    # Time the flat GA needs to reach the quality of the multiresolution one
+    ttq = time_to_quality(logbook, flat_time, multi_fit)
+
+    print('{:20} {:8.2f} {:8.4f} {:8.2f} {:8.4f} {:>8}'.format(
+        path, flat_time, flat_fit, multi_time, multi_fit,
+        'never' if ttq is None else '{:.2f}'.format(ttq)))
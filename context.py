@@ -0,0 +1,118 @@
+import threading
+import numpy as np
+
+from scanner import MatScanner
+from ssim import host_stats
+
+class HostContext:
+    """Host-only data computed once and reused by every evaluation: the uint8
+    and float32 copies of the host, its SSIM window statistics and the pixel
+    positions of the scan directions already used.
+
+    The positions are cached once per scan direction, for the sequence
+    starting at (0, 0). The sequences of the other offsets are a rotation of
+    it, with the rows or columns rolled for the no row-jump or column-jump
+    orders (MatScanner.shift), so they need no new cache entry. Every cached
+    order takes 4 bytes per host pixel (8 beyond 2**31 pixels), and orders
+    are only cached while they fit in cache_bytes. The positions of the other
+    directions are computed for the requested range only. The default keeps
+    the 16 directions of a 512x512 host, 4 of a 1024x1024 one and none of a
+    2048x2048 one.
+
+    Arrays are read-only, so a context can be shared between threads. It
+    pickles without its caches to be sent to other processes.
+    """
+
+    def __init__(self, host, cache_bytes=1 << 24):
+        self.host = self._readonly(np.array(host, dtype=np.uint8))
+        self.shape = self.host.shape
+        self.size = self.host.size
+        self.cache_bytes = cache_bytes
+        self._init_cache()
+
+    def _init_cache(self):
+        self._float = None
+        self._ssim_stats = dict()
+        self._orders = dict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'host' : self.host, 'cache_bytes' : self.cache_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['host'], state['cache_bytes'])
+
+    @staticmethod
+    def _readonly(array):
+        array.flags.writeable = False
+        return array
+
+    @property
+    def flat(self):
+        """Flattened read-only view of the host"""
+        return self.host.reshape(-1)
+
+    @property
+    def float(self):
+        """Read-only float32 copy of the host"""
+        if self._float is None:
+            self._float = self._readonly(self.host.astype(np.float32))
+        return self._float
+
+    def ssim_stats(self, win=7):
+        """Read-only window means and variances of the host (ssim.host_stats)"""
+        if win not in self._ssim_stats:
+            mu, var = host_stats(self.host, win)
+            self._ssim_stats[win] = (self._readonly(mu), self._readonly(var))
+        return self._ssim_stats[win]
+
+    def _order(self, direction):
+        """Read-only positions of the whole sequence of the scan direction
+        starting at (0, 0), or None when it does not fit in cache_bytes"""
+        itemsize = 4 if self.size < 2**31 else 8
+        with self._lock:
+            order = self._orders.get(direction)
+            used = sum(o.nbytes for o in self._orders.values())
+        if order is not None or used + self.size * itemsize > self.cache_bytes:
+            return order
+
+        # Computed outside the lock, so threads sharing the context are not
+        # serialized. The first order published is kept.
+        order = MatScanner.positions(self.shape, 0, 0, direction)
+        order = self._readonly(order.astype(np.int32 if itemsize == 4
+                                            else np.int64))
+
+        with self._lock:
+            if direction in self._orders:
+                return self._orders[direction]
+
+            used = sum(o.nbytes for o in self._orders.values())
+            if used + order.nbytes <= self.cache_bytes:
+                self._orders[direction] = order
+
+        return order
+
+    def positions(self, chromosome, start=0, stop=None):
+        """Same as MatScanner.positions_genetic, from the cached order of the
+        chromosome scan direction when there is one"""
+        if stop is None:
+            stop = self.size
+
+        direction = int(chromosome[0])
+        order = self._order(direction)
+        if order is None:
+            return MatScanner.positions_genetic(self.shape, chromosome, start,
+                                                stop)
+
+        s, dy, dx = MatScanner.shift(self.shape, chromosome[2], chromosome[1],
+                                     direction)
+
+        # Rotate the sequence by s, wrapping around its end
+        first = (start + s) % self.size
+        last = first + stop - start
+        if last <= self.size:
+            p = order[first:last]
+        else:
+            p = np.concatenate((order[first:], order[:last - self.size]))
+
+        return MatScanner.roll_positions(p, self.shape, dy, dx)
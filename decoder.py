@@ -1,62 +1,131 @@
 import numpy as np
+import helper_individual
+
+from concurrent.futures import ThreadPoolExecutor
 
 class Decoder:
     """Methods to decode secret messages from a host image"""
 
+    # Secret bytes decoded per bit-plane and iteration
+    chunk_size = 1 << 16
+
     @staticmethod
-    def _decode(stego, secret, idx):
-        return np.append(secret, stego[idx])
-    
+    def _decode(stego, idx, start, nbits, positions=None):
+        """Returns nbits secret bits from the idx bits of the stego pixels
+        following start. With positions, stego is the flattened image and
+        positions(start, stop) returns where the pixels of the sequence are."""
+        npixel = -(-nbits // len(idx))
+
+        if positions is None:
+            pixels = stego[start : start + npixel]
+        else:
+            pixels = stego[positions(start, start + npixel)]
+
+        # Secret bits [npixel, len(idx)]
+        bits = (pixels[:, None] >> (7 - idx).astype(np.uint8)) & 1
+        return bits.ravel()[:nbits]
+
+    @classmethod
+    def _decode_chunk(cls, stego, chromosome, idx, secret, i, nbytes, start,
+                      positions=None):
+        """Decode the secret bytes i:i+nbytes, read from the stego pixels of
+        the sequence following start"""
+        chunk = np.packbits(cls._decode(stego, idx, start + i * 8 // len(idx),
+                                        nbytes * 8, positions))
+
+        # SB-Pole: Compliment secret bits
+        if chromosome[4]:
+            np.invert(chunk, chunk)
+
+        secret[i : i + len(chunk)] = chunk
+
+    @classmethod
+    def _decode_sequence(cls, stego, chromosome, out, start=0,
+                         positions=None, workers=1):
+        """Decode len(out) secret bytes in chunks from the stego pixels
+        following start. With several workers, the chunks are decoded
+        concurrently on a thread pool. Returns the number of stego pixels
+        used."""
+        idx = helper_individual.bitplanes(chromosome)
+
+        # SB-Dire: reverse the secret sequence
+        secret = out[::-1] if chromosome[5] else out
+
+        # Every chunk reads a whole number of stego pixels and writes its own
+        # slice of the secret
+        step = cls.chunk_size * len(idx)
+        chunks = [(i, min(step, len(out) - i))
+                  for i in range(0, len(out), step)]
+
+        def decode_chunk(chunk):
+            cls._decode_chunk(stego, chromosome, idx, secret, *chunk, start,
+                              positions)
+
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(min(workers, len(chunks))) as pool:
+                # Raise the errors of the workers
+                list(pool.map(decode_chunk, chunks))
+        else:
+            for chunk in chunks:
+                decode_chunk(chunk)
+
+        return -(-len(out) * 8 // len(idx))
+
     @classmethod
-    def decode(cls, stego, chromosome, npixel):
+    def decode(cls, stego, chromosome, npixel, out=None, positions=None,
+               workers=1):
         """Embed secret bits into stego bits according to the mask
         The chromosome has the following gene representation:
         [dir, xoffset, yoffset, bit-planes, sb-pole, sb-dire, bp-dire]
 
         Args:
-        	stego: Stego pixel sequence 
+        	stego: Stego pixel sequence
         	chromosome: Chromosome of the GA
-        
+        	npixel: number of secret pixels (bytes)
+        	out: optional writable uint8 sequence receiving the secret, like
+        	     a np.memmap opened in 'w+' mode
+        	positions: optional function (start, stop) returning the positions
+        	           of the pixel sequence when stego is the flattened image
+        	workers: number of threads decoding chunks of the sequence
+
         Return:
-        	numpy.array: secret bit sequence
+        	numpy.array: secret byte sequence
         """
-        # Bit-Planes: Extract the bit mask
-        mask = np.unpackbits(np.array([chromosome[3]], dtype='uint8'))[4:]
-        idx = np.argwhere(mask == True)
-        capacity = round(8 / len(idx)) * npixel
+        # Convert data to uint8
+        stego = np.asarray(stego, dtype='uint8')
 
-        # BP-Dire: Use LSB or MSB
-        if chromosome[6]:
-            idx += 4
+        if out is None:
+            out = np.empty(npixel, dtype=np.uint8)
 
-        # Convert data to uint8
-        stego = stego.astype('uint8')
-
-        # Stego bits [nbits]
-        stego = np.unpackbits(stego)
-
-        # Create the iterator for the stereo image
-        it = np.nditer(stego, flags=['external_loop', 'buffered'],
-                       op_flags=['readwrite'], buffersize=8)
-        # Decode
-        secret = np.array([], dtype=np.uint8)
-        for _ in range(capacity):
-            secret = cls._decode(it.value, secret, idx)
-            it.iternext()
-
-        # Check if secret is mod 8
-        mod = len(secret) % 8
-        if not mod == 0:
-            secret = np.delete(secret, np.s_[-mod:])
-        
-        secret = np.packbits(secret)
+        cls._decode_sequence(stego, chromosome, out[:npixel],
+                             positions=positions, workers=workers)
+        return out
 
-        # SB-Pole: Compliment secret bits
-        if chromosome[4]:
-            np.invert(secret, secret)
+    @classmethod
+    def decode_multi(cls, stego, chromosomes, npixels, positions=None,
+                     workers=1):
+        """Decode the secrets embedded by Embedder.embed_multi
 
-        # SB-Dire: reverse the secret sequence
-        if chromosome[5]:
-            secret = secret[::-1]
+        Args:
+        	stego: Stego pixel sequence
+        	chromosomes: List of base 10 chromosomes, one per secret
+        	npixels: List with the number of pixels of every secret
+        	positions: optional function (start, stop) returning the positions
+        	           of the pixel sequence when stego is the flattened image
+        	workers: number of threads decoding chunks of every sequence
+
+        Return:
+        	list: secret byte sequences
+        """
+        # Convert data to uint8
+        stego = np.asarray(stego, dtype='uint8')
+
+        secrets = list()
+        start = 0
+        for chromosome, npixel in zip(chromosomes, npixels):
+            secret = np.empty(npixel, dtype=np.uint8)
+            start += cls._decode_sequence(stego, chromosome, secret, start,
+                                          positions, workers)
+            secrets.append(secret)
 
-        return secret
+        return secrets
@@ -1,10 +1,14 @@
 import numpy as np
+import helper_individual
 
 class Embedder:
 
+    # Secret bytes processed per bit-plane and iteration
+    chunk_size = 1 << 16
+
     class EmbeddingError(Exception):
         """Exception raised for embedding errors"""
-        
+
         def __init__(self, value):
             self.value = value
 
@@ -12,9 +16,114 @@ class Embedder:
             return repr(self.value)
 
     @staticmethod
-    def _embed(stego, secret, idx):
-        """Embed the secret bits in stego[idx]"""
-        np.put(stego, idx, secret)
+    def as_payload(secret):
+        """Returns the secret message as a flat uint8 sequence. Images are
+        flattened and any buffer-protocol object (bytes, memoryview, mmap) is
+        wrapped with np.frombuffer. Neither of them is copied."""
+        if isinstance(secret, np.ndarray):
+            return secret.ravel()
+
+        return np.frombuffer(secret, dtype=np.uint8)
+
+    @staticmethod
+    def _pixel_values(secret, idx):
+        """Returns the idx bits of every stego pixel carrying the secret bytes
+        and the mask of those bits. The last pixel repeats the remaining bits
+        like np.put does.
+
+        The bits are shifted straight from the secret bytes into their
+        bit-plane, without unpacking the secret.
+        """
+        nbits = len(secret) * 8
+        npixel = -(-nbits // len(idx))
+        tail = nbits % len(idx)
+
+        values = np.zeros(npixel, dtype=np.uint8)
+        first = np.arange(npixel, dtype=np.int64) * len(idx)
+
+        for j, b in enumerate(idx):
+            g = first + j
+            if tail:
+                g = np.where(g < nbits, g, nbits - tail + (g - nbits) % tail)
+
+            bits = (secret[g >> 3] >> (7 - (g & 7)).astype(np.uint8)) & 1
+            values |= bits << np.uint8(7 - b)
+
+        mask = np.uint8(np.bitwise_or.reduce(1 << (7 - idx)))
+        return values, mask
+
+    @staticmethod
+    def _embed(stego, values, mask, start, positions=None):
+        """Replace the mask bits of the stego pixels following start. With
+        positions, stego is the flattened image and positions(start, stop)
+        returns where the pixels of the sequence are."""
+        if positions is None:
+            pos = np.s_[start : start + len(values)]
+        else:
+            pos = positions(start, start + len(values))
+
+        stego[pos] = (stego[pos] & ~mask) | values
+
+    @staticmethod
+    def _error(stego, values, mask, start, positions=None):
+        """Returns the sum of squared differences between the stego pixels
+        following start and the same pixels with the mask bits replaced"""
+        if positions is None:
+            pos = np.s_[start : start + len(values)]
+        else:
+            pos = positions(start, start + len(values))
+
+        old = stego[pos]
+        diff = ((old & ~mask) | values).astype(np.int64) - old
+        return int(np.dot(diff, diff))
+
+    @classmethod
+    def _chunks(cls, secret, chromosome, start=0):
+        """Yields the (values, mask, start) of the stego pixels carrying every
+        chunk of the secret sequence, starting in the pixel start"""
+        idx = helper_individual.bitplanes(chromosome)
+
+        # SB-Dire: reverse the secret sequence
+        if chromosome[5]:
+            secret = secret[::-1]
+
+        # Every chunk fills a whole number of stego pixels
+        step = cls.chunk_size * len(idx)
+        for i in range(0, len(secret), step):
+            # Convert data to uint8. Copies the chunk, so the secret can be
+            # a read-only buffer
+            chunk = secret[i : i + step].astype('uint8')
+
+            # SB-Pole: Compliment secret bits
+            if chromosome[4]:
+                np.invert(chunk, chunk)
+
+            values, mask = cls._pixel_values(chunk, idx)
+            yield values, mask, start + i * 8 // len(idx)
+
+    @classmethod
+    def _embed_sequence(cls, stego, secret, chromosome, start=0,
+                        positions=None):
+        """Embed a whole secret sequence in chunks into the stego pixels
+        following start. Returns the number of stego pixels used."""
+        for values, mask, first in cls._chunks(secret, chromosome, start):
+            cls._embed(stego, values, mask, first, positions)
+
+        idx = helper_individual.bitplanes(chromosome)
+        return -(-len(secret) * 8 // len(idx))
+
+    @classmethod
+    def _check(cls, stego, secret, chromosome):
+        """Raise EmbeddingError if the secret does not fit into stego"""
+        # Bit-Planes: Extract the bit mask
+        idx = helper_individual.bitplanes(chromosome)
+        if len(idx) == 0:
+            raise cls.EmbeddingError('No bit-planes selected.')
+
+        capacity = round(8 / len(idx)) * len(secret)
+
+        if capacity > stego.size:
+            raise cls.EmbeddingError('Insufficient stego pixel size.')
 
     @classmethod
     def embed(cls, stego, secret, chromosome):
@@ -22,51 +131,97 @@ class Embedder:
         The chromosome has the following gene representation:
         [dir, xoffset, yoffset, bit-planes, sb-pole, sb-dire, bp-dire]
 
+        The secret is embedded in chunks, so it can be any flat uint8 sequence
+        (a np.memmap or a np.frombuffer view) without being loaded at once.
+
         Args:
-        	stego: Stego pixel sequence 
+        	stego: Stego pixel sequence
         	secret: Secret pixel sequence
         	chromosome: Chromosome of the GA
-        
+
         Return:
-        	numpy.array: stego bit sequence with embedded bits
+        	numpy.array: stego pixel sequence with embedded bits
         """
-        # Bit-Planes: Extract the bit mask
-        mask = np.unpackbits(np.array([chromosome[3]], dtype='uint8'))[4:]
-        idx = np.argwhere(mask == True)
-        capacity = round(8 / len(idx)) * len(secret)
-
-        if capacity > stego.shape[0]:
-            raise cls.EmbeddingError('Insufficient stego pixel size.')
+        cls._check(stego, secret, chromosome)
 
         # Convert data to uint8
         stego = stego.astype('uint8')
-        secret = secret.astype('uint8')
 
-        # SB-Pole: Compliment secret bits
-        if chromosome[4]:
-            np.invert(secret, secret)
+        cls._embed_sequence(stego, secret, chromosome)
+        return stego
 
-        # SB-Dire: reverse the secret sequence
-        if chromosome[5]:
-            secret = secret[::-1]
+    @classmethod
+    def embed_scan(cls, stego, secret, chromosome, positions):
+        """Embed secret bits straight into the pixels of a flattened image,
+        without scanning it. Only the pixels carrying the secret are read and
+        written, in place.
+
+        Args:
+        	stego: flattened uint8 image, modified in place
+        	secret: Secret pixel sequence
+        	chromosome: Chromosome of the GA
+        	positions: function (start, stop) returning the image positions of
+        	           the pixel sequence, like MatScanner.positions_genetic
 
-        # BP-Dire: Use LSB or MSB
-        if chromosome[6]:
-            idx += 4
+        Return:
+        	numpy.array: the stego image
+        """
+        cls._check(stego, secret, chromosome)
+        cls._embed_sequence(stego, secret, chromosome, positions=positions)
+        return stego
 
-        # Secret bitarray [nbits]
-        secret = np.unpackbits(secret)
+    @classmethod
+    def squared_error(cls, stego, secret, chromosome, positions):
+        """Returns the sum of squared differences between a flattened image
+        and the same image with the secret embedded, without modifying or
+        copying it. Only the pixels carrying the secret are read.
+
+        Args:
+        	stego: flattened uint8 image
+        	secret: Secret pixel sequence
+        	chromosome: Chromosome of the GA
+        	positions: function (start, stop) returning the image positions of
+        	           the pixel sequence, like MatScanner.positions_genetic
+
+        Return:
+        	int
+        """
+        cls._check(stego, secret, chromosome)
+
+        return sum(cls._error(stego, values, mask, first, positions)
+                   for values, mask, first in cls._chunks(secret, chromosome))
+
+    @classmethod
+    def embed_multi(cls, stego, secrets, chromosomes, positions=None):
+        """Embed several secrets into consecutive, non-overlapping segments of
+        the stego sequence. Every secret uses the bit-plane genes of its own
+        chromosome and starts in the pixel following the previous segment.
+
+        Args:
+        	stego: Stego pixel sequence, or the flattened uint8 image modified
+        	       in place when positions is given
+        	secrets: List of secret pixel sequences
+        	chromosomes: List of base 10 chromosomes, one per secret
+        	positions: optional function (start, stop) returning the image
+        	           positions of the pixel sequence
+
+        Return:
+        	numpy.array: stego pixel sequence with embedded bits
+        """
+        if positions is None:
+            # Convert data to uint8
+            stego = stego.astype('uint8')
 
-        # Stego bits [nbits]
-        stego = np.unpackbits(stego)
+        start = 0
+        for secret, chromosome in zip(secrets, chromosomes):
+            idx = helper_individual.bitplanes(chromosome)
+            if len(idx) == 0:
+                raise cls.EmbeddingError('No bit-planes selected.')
 
-        # Embed the secret bits into the stego image
-        it = np.nditer(stego, flags=['external_loop', 'buffered'],
-                       op_flags=['readwrite'], buffersize=8)
+            if start + -(-len(secret) * 8 // len(idx)) > stego.size:
+                raise cls.EmbeddingError('Insufficient stego pixel size.')
 
-        while len(secret) > 0:
-            cls._embed(it.value[...], secret[:len(idx)], idx)
-            secret = np.delete(secret, np.s_[:len(idx)])
-            it.iternext()
+            start += cls._embed_sequence(stego, secret, chromosome, start,
+                                         positions)
 
-        return np.packbits(stego)
+        return stego
@@ -1,34 +1,76 @@
 import numpy as np
 import random
 import argparse
+import os
+import time
 import helper_individual
 
+from functools import partial
+
 from PIL import Image
 from matplotlib import pyplot as plt
 from scanner import MatScanner
 from embedder import Embedder
 from decoder import Decoder
-from psnr import psnr
+from psnr import psnr, psnr_mse
+from context import HostContext
+from ssim import psnr_ssim
 from deap import algorithms, base, creator, tools
+from surrogate import AdditiveSurrogate, KNNSurrogate, eaSurrogate
+from warmstart import HallOfFameStore, WarmStart
+from logstore import LogStore
+
+def as_payload(secret):
+    """Returns the secret message as a flat uint8 sequence
+    (Embedder.as_payload)"""
+    return Embedder.as_payload(secret)
+
+def load_payload(path):
+    """Memory-maps a file as a raw secret message. The payload is streamed
+    from disk while embedding, so it is never loaded at once."""
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+def _scan(stego, chromosome):
+    """Returns the flattened image and the function giving the positions of
+    its pixel sequence, from an image or a HostContext"""
+    if isinstance(stego, HostContext):
+        return stego.flat, partial(stego.positions, chromosome)
+
+    return (stego.reshape(-1),
+            partial(MatScanner.positions_genetic, stego.shape, chromosome))
 
 def embed(stego, secret, chromosome):
-    """Embed secret message into the host using the chromosome"""
+    """Embed secret message into the host (an image or a HostContext) using
+    the chromosome. The secret bits are written straight into a single copy
+    of the host, at the positions of the pixel sequence, without scanning and
+    reshaping it."""
     if len(chromosome) > 7:
         chromosome = helper_individual.packchromosome(chromosome)
 
-    # Convert to a flattened pixel sequence
-    stego_sequence = MatScanner.scan_genetic(stego, chromosome)
-    secret = secret.flatten()
-    stego_sequence = Embedder.embed(stego_sequence, secret, chromosome)
+    flat, positions = _scan(stego, chromosome)
+    secret = as_payload(secret)
+    stego1 = np.array(flat, dtype=np.uint8)
+    Embedder.embed_scan(stego1, secret, chromosome, positions)
 
-    # Reshape the stego image
-    return MatScanner.reshape_genetic(stego_sequence, stego.shape, chromosome)
+    return stego1.reshape(stego.shape)
 
 def fitness(chromosome, stego, secret):
-    """Computes fitness for current chromosome"""
+    """Computes fitness for current chromosome. With a HostContext, the error
+    is computed from the pixels carrying the secret, without building the
+    stego image."""
     if len(chromosome) > 7:
         chromosome = helper_individual.packchromosome(chromosome)
 
+    if isinstance(stego, HostContext):
+        flat, positions = _scan(stego, chromosome)
+        try:
+            error = Embedder.squared_error(flat, as_payload(secret),
+                                           chromosome, positions)
+        except:
+            return (0,)
+
+        return (psnr_mse(error / stego.size),)
+
     # Embed the secret sequence
     try:
         stego1 = embed(stego, secret, chromosome)
@@ -37,13 +79,16 @@ def fitness(chromosome, stego, secret):
 
     return (psnr(stego, stego1),)
 
-def decode(stego, s_shape, chromosome):
+def decode(stego, s_shape, chromosome, out=None, workers=1):
     """Decode the secret message embedded into the host image
 
     Args:
-    	stego: stego image
-    	s_shape: secret message shape
+    	stego: stego image or HostContext
+    	s_shape: secret message shape, or its length in bytes
     	chromosome: solution chromosome
+    	out: optional writable buffer (bytearray, np.memmap...) receiving the
+    	     secret bytes
+    	workers: number of threads decoding chunks of the pixel sequence
 
     Return:
     	np.array: the secret message
@@ -51,30 +96,117 @@ def decode(stego, s_shape, chromosome):
     if len(chromosome) > 7:
         chromosome = helper_individual.packchromosome(chromosome)
 
-    stego = MatScanner.scan_genetic(stego, chromosome)
-    secret_pixels = s_shape[0] * s_shape[1] if len(s_shape) > 1 else s_shape[0]
-    secret = Decoder.decode(stego, chromosome, secret_pixels)
+    flat, positions = _scan(stego, chromosome)
+    secret_pixels = int(np.prod(s_shape))
+
+    if out is not None:
+        if not isinstance(out, np.ndarray):
+            out = np.frombuffer(out, dtype=np.uint8)
+        return Decoder.decode(flat, chromosome, secret_pixels, out, positions,
+                              workers)
+
+    secret = Decoder.decode(flat, chromosome, secret_pixels,
+                            positions=positions, workers=workers)
     return secret.reshape(s_shape)
 
+def embed_multi(stego, secrets, chromosome):
+    """Embed several secret messages into the host using a multi-payload
+    chromosome. Secrets are packed into consecutive segments of the same scan.
+    """
+    chromosomes = helper_individual.split_multichromosome(chromosome,
+                                                          len(secrets))
+
+    flat, positions = _scan(stego, chromosomes[0])
+    secrets = [as_payload(secret) for secret in secrets]
+    stego1 = np.array(flat, dtype=np.uint8)
+    Embedder.embed_multi(stego1, secrets, chromosomes, positions)
+
+    return stego1.reshape(stego.shape)
+
+def fitness_multi(chromosome, stego, secrets):
+    """Computes fitness for a multi-payload chromosome"""
+    # Embed all the secret sequences
+    try:
+        stego1 = embed_multi(stego, secrets, chromosome)
+    except:
+        return (0,)
+
+    if isinstance(stego, HostContext):
+        return (psnr(stego.float, stego1),)
+
+    return (psnr(stego, stego1),)
+
+def fitness_nsga2(chromosome, stego, secrets):
+    """Computes the (psnr, SSIM) fitness of a chromosome embedding one or
+    several secrets. Both metrics come from a single pass over the difference
+    between the stego and the host (ssim.psnr_ssim), reusing the host window
+    statistics of the HostContext."""
+    try:
+        if len(secrets) > 1:
+            stego1 = embed_multi(stego, secrets, chromosome)
+        else:
+            stego1 = embed(stego, secrets[0], chromosome)
+    except:
+        return (0, 0)
+
+    if isinstance(stego, HostContext):
+        return psnr_ssim(stego.host, stego1, stego.ssim_stats())
+
+    return psnr_ssim(stego, stego1)
+
+def decode_multi(stego, s_shapes, chromosome, workers=1):
+    """Decode the secret messages embedded with a multi-payload chromosome
+
+    Args:
+    	stego: stego image or HostContext
+    	s_shapes: list of secret message shapes
+    	chromosome: solution chromosome
+    	workers: number of threads decoding chunks of the pixel sequence
+
+    Return:
+    	list: the secret messages
+    """
+    chromosomes = helper_individual.split_multichromosome(chromosome,
+                                                          len(s_shapes))
+
+    flat, positions = _scan(stego, chromosomes[0])
+    secret_pixels = [int(np.prod(s_shape)) for s_shape in s_shapes]
+    secrets = Decoder.decode_multi(flat, chromosomes, secret_pixels,
+                                   positions, workers)
+    return [secret.reshape(s_shape)
+            for secret, s_shape in zip(secrets, s_shapes)]
+
 
-def imshow(host, stego, secret):
+def imshow(host, stego, *secrets):
     """Show the images with matplotlib"""
-    fig, axes = plt.subplots(1,3)
+    fig, axes = plt.subplots(1, 2 + len(secrets))
 
     axes[0].set_title('Host')
     axes[1].set_title('Stego')
-    axes[2].set_title('Secret')
 
     axes[0].imshow(host, cmap='gray', aspect='equal')
     axes[1].imshow(stego, cmap='gray', aspect='equal')
-    axes[2].imshow(secret, cmap='gray', aspect='equal')
+
+    for ax, secret in zip(axes[2:], secrets):
+        ax.set_title('Secret')
+        ax.imshow(secret, cmap='gray', aspect='equal')
 
     plt.setp(axes, xticklabels=[], yticklabels=[], xticks=[], yticks=[])
 
     plt.show()
 
-def init_chromosome():
-    return creator.Individual(helper_individual.init_chromosome())
+def init_population(n, rng, length=sum(helper_individual.c_rep),
+                    individual=None):
+    """Creates n individuals (creator.Individual by default) from a single
+    random population matrix"""
+    individual = individual or creator.Individual
+    return [individual(c)
+            for c in helper_individual.init_population(n, rng, length)]
+
+def init_individual(rng, length=sum(helper_individual.c_rep),
+                    individual=None):
+    """Creates a single individual like init_population"""
+    return init_population(1, rng, length, individual)[0]
 
 def cxTwoPointCopy(ind1, ind2):
     """Execute a two points crossover with copy on the input individuals. The
@@ -96,71 +228,287 @@ def cxTwoPointCopy(ind1, ind2):
 
     return ind1, ind2
 
+def eaSimple(population, toolbox, cxpb, mutpb, ngen, stats=None,
+             halloffame=None, verbose=__debug__):
+    """Same as algorithms.eaSimple, but the offspring are produced by
+    toolbox.vary when it is registered. Used to plug the population level
+    operators of helper_individual."""
+    vary = getattr(toolbox, 'vary', None) or partial(algorithms.varAnd,
+                                                     toolbox=toolbox)
+
+    logbook = tools.Logbook()
+    logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
+
+    for gen in range(ngen + 1):
+        if gen > 0:
+            offspring = toolbox.select(population, len(population))
+            population[:] = vary(offspring, cxpb=cxpb, mutpb=mutpb)
+
+        # Evaluate the individuals with an invalid fitness
+        invalid_ind = [ind for ind in population if not ind.fitness.valid]
+        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
+
+        if halloffame is not None:
+            halloffame.update(population)
+
+        record = stats.compile(population) if stats else {}
+        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+        if verbose:
+            print(logbook.stream)
+
+    return population, logbook
+
+def eaMuPlusLambda(population, toolbox, mu, lambda_, cxpb, mutpb, ngen,
+                   stats=None, halloffame=None, verbose=__debug__):
+    """Same as algorithms.eaMuPlusLambda, but the lambda_ offspring are
+    produced by toolbox.vary (like eaSimple) from parents drawn at random.
+    Crossover and mutation are applied independently, so cxpb + mutpb may be
+    greater than 1 as in eaSimple."""
+    vary = getattr(toolbox, 'vary', None) or partial(algorithms.varAnd,
+                                                     toolbox=toolbox)
+
+    logbook = tools.Logbook()
+    logbook.header = ['gen', 'nevals'] + (stats.fields if stats else [])
+
+    for gen in range(ngen + 1):
+        offspring = list()
+        if gen > 0:
+            parents = [random.choice(population) for _ in range(lambda_)]
+            offspring = vary(parents, cxpb=cxpb, mutpb=mutpb)
+
+        # Evaluate the individuals with an invalid fitness
+        invalid_ind = [ind for ind in population + offspring
+                       if not ind.fitness.valid]
+        fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+        for ind, fit in zip(invalid_ind, fitnesses):
+            ind.fitness.values = fit
+
+        # Parents and offspring compete for the mu places
+        if gen > 0:
+            population[:] = toolbox.select(population + offspring, mu)
+
+        if halloffame is not None:
+            halloffame.update(population)
+
+        record = stats.compile(population) if stats else {}
+        logbook.record(gen=gen, nevals=len(invalid_ind), **record)
+        if verbose:
+            print(logbook.stream)
+
+    return population, logbook
+
 def setup_deap_individuals():
     # Define the individuals
-    creator.create('FitnessMax', base.Fitness, weights=(1.0,))
-    creator.create('Individual', np.ndarray, fitness=creator.FitnessMax)
+    if not hasattr(creator, 'Individual'):
+        creator.create('FitnessMax', base.Fitness, weights=(1.0,))
+        creator.create('Individual', np.ndarray, fitness=creator.FitnessMax)
 
-def main():
-    ap = argparse.ArgumentParser()
+    if not hasattr(creator, 'IndividualMulti'):
+        # Multi-objective individuals: maximize psnr and SSIM
+        creator.create('FitnessMulti', base.Fitness, weights=(1.0, 1.0))
+        creator.create('IndividualMulti', np.ndarray,
+                       fitness=creator.FitnessMulti)
 
-    ap.add_argument('-ht', '--host', required=True)
-    ap.add_argument('-s', '--secret', required=True)
-    ap.add_argument('-g', '--generations', default=80, type=int)
-    ap.add_argument('-p', '--population', default=100, type=int)
-    ap.add_argument('-c', '--crossover', default=0.7, type=float)
-    ap.add_argument('-m', '--mutation', default=0.25, type=float)
+def evolve(host, secrets, ngen=80, npop=100, cxpb=0.7, mutpb=0.25, seed=None,
+           surrogate=None, screen=0.25, population=None, nsga2=False,
+           verbose=__debug__):
+    """Search the chromosome embedding the secrets into the host
 
-    args = vars(ap.parse_args())
+    Args:
+    	host: host image or HostContext
+    	secrets: list of secret messages, packed together when more than one
+    	ngen: number of generations
+    	npop: population size
+    	cxpb: crossover probability
+    	mutpb: mutation probability
+    	seed: seed of the random number generators
+    	surrogate: optional Surrogate model pre-screening the offspring
+    	screen: fraction of the offspring evaluated in surrogate mode
+    	population: optional base 2 chromosomes seeding the initial population.
+    	            Chromosomes of another length, like the base 10 ones of
+    	            multires, are left out.
+    	nsga2: maximize psnr and SSIM with NSGA-II selection instead of psnr
+    	       only. The halloffame is then the Pareto front.
 
-    NGEN, NPOP, LAMBDA = args['generations'], args['population'], 100
-    CXPB, MUTPB = args['crossover'], args['mutation']
-    ICXPB, IMUTPB = 0.5, 0.2
+    Return:
+    	(population, logbook, halloffame)
+    """
+    if nsga2 and surrogate is not None:
+        raise ValueError('Surrogate screening only supports the psnr fitness')
 
-    # Convert to grayscale: http://pillow.readthedocs.io/en/5.0.0/handbook/concepts.html#concept-modes
-    host = np.array(Image.open(args['host']).convert('L'))
-    secret = np.array(Image.open(args['secret']).convert('L'))
+    IMUTPB = 0.2
+
+    # Reproducible runs: DEAP selection draws from the random module
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
 
     setup_deap_individuals()
 
     toolbox = base.Toolbox()
 
-    # Population methods
-    toolbox.register('individual', init_chromosome)
-    toolbox.register('population', tools.initRepeat, list, toolbox.individual)
-
-    # Genetic operators
-    toolbox.register('evaluate', fitness, stego=host, secret=secret)
+    # Population methods: several secrets are packed into the host in a
+    # single optimization with a longer chromosome
+    length = sum(helper_individual.multi_rep(len(secrets)))
+    individual = creator.IndividualMulti if nsga2 else creator.Individual
+    toolbox.register('individual', init_individual, rng=rng, length=length,
+                     individual=individual)
+    toolbox.register('population', init_population, rng=rng, length=length,
+                     individual=individual)
+
+    # Genetic operators: the host is preprocessed once for every evaluation
+    context = host if isinstance(host, HostContext) else HostContext(host)
+    if nsga2:
+        toolbox.register('evaluate', fitness_nsga2, stego=context,
+                         secrets=secrets)
+    elif len(secrets) > 1:
+        toolbox.register('evaluate', fitness_multi, stego=context,
+                         secrets=secrets)
+    else:
+        toolbox.register('evaluate', fitness, stego=context, secret=secrets[0])
     toolbox.register('mate', cxTwoPointCopy)
     toolbox.register('mutate', tools.mutFlipBit, indpb=IMUTPB)
-    toolbox.register('select', tools.selTournament, tournsize=2)
+    if nsga2:
+        toolbox.register('select', tools.selNSGA2)
+    else:
+        toolbox.register('select', tools.selTournament, tournsize=2)
+    toolbox.register('vary', helper_individual.varAnd, toolbox=toolbox,
+                     indpb=IMUTPB, rng=rng)
+
+    pop = toolbox.population(n=npop)
+    if population is not None:
+        seeds = [c for c in population if len(c) == length][:npop]
+        pop[:len(seeds)] = [individual(c) for c in seeds]
+
+    if nsga2:
+        hof = tools.ParetoFront(similar=np.array_equal)
+    else:
+        hof = tools.HallOfFame(3, similar=np.array_equal)
+
+    # Per objective statistics in NSGA-II mode
+    axis = 0 if nsga2 else None
+    stats = tools.Statistics(lambda i : i.fitness.values)
+    stats.register('avg', np.mean, axis=axis)
+    stats.register('std', np.std, axis=axis)
+    stats.register('min', np.min, axis=axis)
+    stats.register('max', np.max, axis=axis)
+
+    if nsga2:
+        # Parents and offspring compete for the npop places of the next
+        # generation
+        pop, logbook = eaMuPlusLambda(pop, toolbox, mu=npop, lambda_=npop, cxpb=cxpb, mutpb=mutpb, ngen=ngen, stats=stats, halloffame=hof, verbose=verbose)
+    elif surrogate is not None:
+        pop, logbook = eaSurrogate(pop, toolbox, cxpb=cxpb, mutpb=mutpb, ngen=ngen, surrogate=surrogate, screen=screen, stats=stats, halloffame=hof, verbose=verbose)
+    else:
+        pop, logbook = eaSimple(pop, toolbox, cxpb=cxpb, mutpb=mutpb, ngen=ngen, stats=stats, halloffame=hof, verbose=verbose)
+
+    return pop, logbook, hof
+
+def log_run(store, args, logbook, hof):
+    """Writes the logbook of a run started from the command line into the
+    LogStore, with its parameters and best fitness"""
+    run_id = args['run_id']
+    if run_id is None:
+        names = [os.path.splitext(os.path.basename(p))[0]
+                 for p in [args['host']] + args['secret']]
+        run_id = '-'.join(names + [time.strftime('%Y%m%d%H%M%S')])
+
+    params = {k : args[k] for k in ('host', 'secret', 'generations',
+                                    'population', 'crossover', 'mutation',
+                                    'seed', 'surrogate', 'nsga2')}
+    params['fitness'] = list(hof.items[0].fitness.values)
+    store.write(run_id, logbook, **params)
 
-    pop = toolbox.population(n=NPOP)
+def main():
+    ap = argparse.ArgumentParser()
 
-    hof = tools.HallOfFame(3, similar=np.array_equal)
+    ap.add_argument('-ht', '--host', required=True)
+    ap.add_argument('-s', '--secret', required=True, nargs='+')
+    ap.add_argument('-g', '--generations', default=80, type=int)
+    ap.add_argument('-p', '--population', default=100, type=int)
+    ap.add_argument('-c', '--crossover', default=0.7, type=float)
+    ap.add_argument('-m', '--mutation', default=0.25, type=float)
+    ap.add_argument('-r', '--raw', action='store_true',
+                    help='hide the secret files as raw bytes')
+    ap.add_argument('--seed', type=int,
+                    help='seed of the random number generators')
+    ap.add_argument('--surrogate', choices=['additive', 'knn'],
+                    help='pre-screen the offspring with a surrogate model')
+    ap.add_argument('--screen', default=0.25, type=float,
+                    help='fraction of the offspring evaluated by the GA '
+                    'in surrogate mode')
+    ap.add_argument('--nsga2', action='store_true',
+                    help='maximize psnr and SSIM, returning the Pareto front')
+    ap.add_argument('--hof-store',
+                    help='directory keeping the hall of fame of every host')
+    ap.add_argument('--threshold', default=30, type=float,
+                    help='minimum fitness of a warm start from the hall of '
+                    'fame store')
+    ap.add_argument('--log-store',
+                    help='directory storing the logbook columns of the runs')
+    ap.add_argument('--run-id',
+                    help='name of the run in the log store, the host and '
+                    'secret names followed by a timestamp by default')
 
-    stats = tools.Statistics(lambda i : i.fitness.values)
-    stats.register('avg', np.mean)
-    stats.register('std', np.std)
-    stats.register('min', np.min)
-    stats.register('max', np.max)
+    args = vars(ap.parse_args())
 
-    pop, logbook = algorithms.eaSimple(pop, toolbox, cxpb=CXPB, mutpb=MUTPB, ngen=NGEN, stats=stats, halloffame=hof)
+    NGEN, NPOP = args['generations'], args['population']
+    CXPB, MUTPB = args['crossover'], args['mutation']
 
-    # Embed secret image using the best individual
-    stego = embed(host, secret, hof.items[0])
+    # Convert to grayscale: http://pillow.readthedocs.io/en/5.0.0/handbook/concepts.html#concept-modes
+    host = np.array(Image.open(args['host']).convert('L'))
+    if args['raw']:
+        secrets = [load_payload(s) for s in args['secret']]
+    else:
+        secrets = [np.array(Image.open(s).convert('L')) for s in args['secret']]
+
+    model = None
+    if args['surrogate']:
+        model = (AdditiveSurrogate() if args['surrogate'] == 'additive'
+                 else KNNSurrogate())
+
+    # Warm start: reuse the hall of fame stored for this host
+    store = HallOfFameStore(args['hof_store']) if args['hof_store'] else None
+    items = store.load(host, len(secrets)) if store else None
+
+    warm = None
+    if items is not None:
+        warm = WarmStart(host, items, len(secrets)).reembed(secrets,
+                                                            args['threshold'])
+
+    if warm is not None:
+        stego, best, fit = warm
+        pop, logbook, hof = None, None, None
+        print('Warm start: fitness {:.4f}'.format(fit))
+    else:
+        pop, logbook, hof = evolve(host, secrets, NGEN, NPOP, CXPB, MUTPB,
+                                   seed=args['seed'], surrogate=model,
+                                   screen=args['screen'], population=items,
+                                   nsga2=args['nsga2'])
+        if store:
+            store.save(host, hof, len(secrets))
+
+        if args['log_store']:
+            log_run(LogStore(args['log_store']), args, logbook, hof)
+
+        # Embed secret images using the best individual
+        if len(secrets) > 1:
+            stego = embed_multi(host, secrets, hof.items[0])
+        else:
+            stego = embed(host, secrets[0], hof.items[0])
 
     # Show the best solution
-    imshow(host, stego, secret)
+    imshow(host, stego, *([] if args['raw'] else secrets))
 
-    return host, stego, secret, pop, stats, logbook, hof
+    return host, stego, secrets, pop, logbook, hof
 
 if __name__ == '__main__':
-    host, stego, secret, pop, stats, logbook, hof = main()
+    host, stego, secrets, pop, logbook, hof = main()
     attrs = {
         'host' : host,
         'stego' : stego,
-        'secret' : secret,
+        'secrets' : secrets,
         'pop' : pop,
         'logbook' : logbook,
         'hof' : hof
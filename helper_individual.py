@@ -23,23 +23,146 @@ def init_chromosome():
 
     return np.array(c , dtype=np.uint8)
 
-def packchromosome(chromosome):
+def init_population(n, rng, length=sum(c_rep)):
+    """Returns n random base 2 chromosomes as a (n, length) uint8 matrix drawn
+    from the np.random.Generator rng"""
+    return rng.integers(0, 2, size=(n, length), dtype=np.uint8)
+
+def cxTwoPoint(population, cxpb, rng):
+    """Two point crossover of a (n, length) population matrix. Consecutive
+    rows (0, 1), (2, 3)... are mated in place with probability cxpb. The cut
+    points follow the same distribution as genstego.cxTwoPointCopy.
+
+    Return:
+    	np.array: boolean mask of the mated rows
+    """
+    n, size = population.shape
+    npairs = n // 2
+
+    mate = rng.random(npairs) < cxpb
+    cxpoint1 = rng.integers(1, size + 1, npairs)
+    cxpoint2 = rng.integers(1, size, npairs)
+
+    swap = cxpoint2 < cxpoint1
+    lower = np.where(swap, cxpoint2, cxpoint1)
+    upper = np.where(swap, cxpoint1, cxpoint2 + 1)
+
+    genes = np.arange(size)
+    segment = ((genes >= lower[:, None]) & (genes < upper[:, None])
+               & mate[:, None])
+
+    ind1, ind2 = population[0 : 2*npairs : 2], population[1 : 2*npairs : 2]
+    ind1[...], ind2[...] = (np.where(segment, ind2, ind1),
+                            np.where(segment, ind1, ind2))
+
+    mated = np.zeros(n, dtype=bool)
+    mated[: 2*npairs] = np.repeat(mate, 2)
+    return mated
+
+def mutFlipBit(population, mutpb, indpb, rng):
+    """Flip bit mutation of a (n, length) population matrix. Every row is
+    mutated in place with probability mutpb, flipping each of its bits with
+    probability indpb.
+
+    Return:
+    	np.array: boolean mask of the mutated rows
+    """
+    mutated = rng.random(len(population)) < mutpb
+    flips = (rng.random(population.shape) < indpb) & mutated[:, None]
+    np.bitwise_xor(population, flips, out=population, casting='unsafe')
+
+    return mutated
+
+def varAnd(population, toolbox, cxpb, mutpb, indpb, rng):
+    """Population level version of deap.algorithms.varAnd. The offspring are
+    crossed over and mutated as a single matrix and the fitness of the
+    modified individuals is invalidated.
+
+    Args:
+    	population: list of individuals
+    	toolbox: deap toolbox with the clone method
+    	cxpb: crossover probability
+    	mutpb: mutation probability
+    	indpb: probability of flipping every bit of a mutated individual
+    	rng: np.random.Generator
+
+    Return:
+    	list: the offspring
+    """
+    offspring = [toolbox.clone(ind) for ind in population]
+    if not offspring:
+        return offspring
+
+    matrix = np.array(offspring, dtype=np.uint8)
+    changed = cxTwoPoint(matrix, cxpb, rng) | mutFlipBit(matrix, mutpb, indpb, rng)
+
+    for i in np.flatnonzero(changed):
+        offspring[i][:] = matrix[i]
+        del offspring[i].fitness.values
+
+    return offspring
+
+def multi_rep(npayloads):
+    """Chromosome representation for several payloads. The scan genes
+    (direction, x-offset, y-offset) are shared and the bit-plane genes
+    (bit-planes, sb-pole, sb-dire, bp-dire) are repeated for every payload.
+    """
+    return c_rep[:3] + c_rep[3:] * npayloads
+
+def init_multichromosome(npayloads):
+    c = list()
+    c.extend(init_gen(4)) # direction 4 bits
+    c.extend(init_gen(8)) # x-offset 8 bits
+    c.extend(init_gen(8)) # y-offset 8 bits
+
+    for _ in range(npayloads):
+        c.extend(init_gen(4)) # bit-planes 4 bits
+        c.extend(init_gen(1)) # sb-pole 1 bit
+        c.extend(init_gen(1)) # sb-dire 1 bit
+        c.extend(init_gen(1)) # bp-dire 1 bit
+
+    return np.array(c , dtype=np.uint8)
+
+def split_multichromosome(chromosome, npayloads):
+    """Split a multi-payload chromosome into one base 10 chromosome per
+    payload. Every chromosome shares the scan genes of the multi-payload one.
+    """
+    rep = multi_rep(npayloads)
+    if len(chromosome) == sum(rep):
+        chromosome = packchromosome(chromosome, rep)
+
+    return [np.concatenate((chromosome[:3], chromosome[3 + 4*i : 7 + 4*i]))
+            for i in range(npayloads)]
+
+def bitplanes(chromosome):
+    """Returns the stego bit indexes (MSB first) selected by the bit-planes
+    and bp-dire genes of a base 10 chromosome"""
+    mask = np.unpackbits(np.array([chromosome[3]], dtype=np.uint8))[4:]
+    idx = np.flatnonzero(mask)
+
+    # BP-Dire: Use LSB or MSB
+    if chromosome[6]:
+        idx += 4
+
+    return idx
+
+def packchromosome(chromosome, rep=c_rep):
     """Convert the base 2 chromosome to base 10"""
-    _chromosome = np.zeros((len(c_rep), 8), dtype=np.uint8)
+    _chromosome = np.zeros((len(rep), 8), dtype=np.uint8)
 
     j = 0
-    for i, c in zip(c_rep, _chromosome):
+    for i, c in zip(rep, _chromosome):
         c[-i:] = chromosome[j : j + i]
         j += i
 
     return np.packbits(_chromosome)
 
-def unpackchromosome(chromosome):
+def unpackchromosome(chromosome, rep=c_rep):
     """Convert the base 10 chromosome to base 2"""
     chromosome = np.unpackbits(chromosome.reshape(-1, 1), 1)
     _chromosome = np.array(list(), dtype=np.uint8)
     
-    for i, c in zip(c_rep, chromosome):
+    for i, c in zip(rep, chromosome):
         _chromosome = np.append(_chromosome, c[-i:])
 
     return _chromosome
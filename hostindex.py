@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import numpy as np
+
+from PIL import Image
+from scanner import MatScanner
+from psnr import psnr_mse
+
+# Scan orders summarized: rows (raster) and columns (down_right)
+DIRECTIONS = [MatScanner.Direction.raster, MatScanner.Direction.down_right]
+
+# Number of segments every scan order is split into
+SEGMENTS = 32
+
+class HostIndex:
+    """Memory-mapped index of compact host summaries used to rank a library
+    of cover images for a secret before running the GA.
+
+    For every host and scan direction, the pixel sequence is split into
+    SEGMENTS equal segments and the cumulative histogram of the 4 least
+    significant bit-planes (the value of pixel & 15) is kept at every segment
+    boundary. It allows estimating the PSNR of embedding a secret into the k
+    LSB planes of any run of consecutive segments.
+
+    Files in the index directory:
+    	meta.json: host paths, directions and number of segments
+    	shapes.npy: (hosts, 2) host shapes
+    	hists.npy: (hosts, directions, segments + 1, 16) cumulative histograms
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        self.paths = meta['paths']
+        self.directions = meta['directions']
+        self.segments = meta['segments']
+        self.shapes = np.load(os.path.join(path, 'shapes.npy'), mmap_mode='r')
+        self.hists = np.load(os.path.join(path, 'hists.npy'), mmap_mode='r')
+
+    @staticmethod
+    def summarize(host, directions=DIRECTIONS, segments=SEGMENTS):
+        """Returns the (directions, segments + 1, 16) cumulative histograms of
+        the 4 LSB planes of the host along every scan direction"""
+        size = host.size
+        bounds = np.round(np.linspace(0, size, segments + 1)).astype(np.int64)
+        segment = np.searchsorted(bounds, np.arange(size), 'right') - 1
+
+        hists = np.zeros((len(directions), segments + 1, 16), dtype=np.int64)
+        for d, direction in enumerate(directions):
+            order = MatScanner.positions(host.shape, 0, 0, direction)
+            low = host.ravel()[order] & 15
+
+            counts = np.bincount(segment * 16 + low,
+                                 minlength=segments * 16)
+            hists[d, 1:] = np.cumsum(counts.reshape(segments, 16), 0)
+
+        return hists
+
+    @classmethod
+    def build(cls, path, hosts, directions=DIRECTIONS, segments=SEGMENTS):
+        """Summarize the host image files into an index directory"""
+        os.makedirs(path, exist_ok=True)
+
+        shapes = np.lib.format.open_memmap(os.path.join(path, 'shapes.npy'),
+                                           mode='w+', dtype=np.int64,
+                                           shape=(len(hosts), 2))
+        hists = np.lib.format.open_memmap(os.path.join(path, 'hists.npy'),
+                                          mode='w+', dtype=np.int64,
+                                          shape=(len(hosts), len(directions),
+                                                 segments + 1, 16))
+
+        for i, host_path in enumerate(hosts):
+            host = np.array(Image.open(host_path).convert('L'))
+            shapes[i] = host.shape
+            hists[i] = cls.summarize(host, directions, segments)
+
+        shapes.flush()
+        hists.flush()
+
+        meta = {
+            'paths' : list(hosts),
+            'directions' : [d.value for d in directions],
+            'segments' : segments
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        return cls(path)
+
+    @staticmethod
+    def secret_distribution(secret, k):
+        """Returns the distribution of the k bits groups of the secret
+        bitstream and of its complement (sb-pole)"""
+        bits = np.unpackbits(np.asarray(secret, dtype=np.uint8).ravel())
+        bits = np.append(bits, np.zeros(-len(bits) % k, dtype=np.uint8))
+
+        weights = 1 << np.arange(k - 1, -1, -1)
+        groups = bits.reshape(-1, k) @ weights
+        q = np.bincount(groups, minlength=2**k) / len(groups)
+
+        return q, q[::-1]
+
+    def estimate(self, secret, hosts=slice(None)):
+        """Estimated best PSNR of embedding the secret into every host
+
+        For every number k of LSB planes, the expected squared error of
+        replacing the k LSB of the host pixels by the secret bits is computed
+        from the histograms of every run of consecutive segments long enough
+        to carry the secret. The best run, k and sb-pole are kept.
+
+        Return:
+        	(psnr, k, direction): arrays with one element per host. psnr is
+        	-inf for hosts too small for the secret.
+        """
+        shapes = np.asarray(self.shapes[hosts])
+        hists = np.asarray(self.hists[hosts], dtype=np.float64)
+        size = shapes.prod(1)
+        nsecret = np.asarray(secret).size
+
+        # Histograms of the runs starting in every segment, wrapping around
+        B = self.segments
+        total = hists[:, :, B:]
+        ext = np.concatenate((hists, total + hists[:, :, 1:]), 2)
+
+        best = np.full(len(size), -np.inf)
+        best_k = np.zeros(len(size), dtype=np.int64)
+        best_dir = np.zeros(len(size), dtype=np.int64)
+
+        for k in range(1, 5):
+            npixel = -(-nsecret * 8 // k)
+            feasible = (round(8 / k) * nsecret <= size) & (npixel <= size)
+
+            # Run length in segments [hosts]
+            length = np.minimum(B, np.ceil(npixel * B / size)).astype(np.int64)
+            start = np.arange(B)
+            end = start[None, :] + length[:, None]
+
+            runs = (np.take_along_axis(ext, end[:, None, :, None], 2)
+                    - ext[:, :, :B])
+            p = runs / np.maximum(runs.sum(3, keepdims=True), 1)
+
+            # Fold the 4 LSB histogram into the k LSB one
+            fold = np.eye(2**k)[np.arange(16) % 2**k]
+            u = np.arange(2**k)
+            cost = (u[None, :] - u[:, None])**2
+
+            error = None
+            for q in self.secret_distribution(secret, k):
+                e = p @ fold @ cost @ q
+                error = e if error is None else np.minimum(error, e)
+
+            # Best run of every host [hosts]
+            flat = error.reshape(len(size), -1)
+            arg = flat.argmin(1)
+            mse = flat[np.arange(len(size)), arg] * npixel / size
+
+            estimate = np.array([psnr_mse(m) for m in mse])
+            estimate[~feasible] = -np.inf
+
+            better = estimate > best
+            best[better] = estimate[better]
+            best_k[better] = k
+            best_dir[better] = np.asarray(self.directions)[arg // B][better]
+
+        return best, best_k, best_dir
+
+    def rank(self, secret, top=10, batch=256):
+        """Returns the top (path, psnr, k, direction) hosts for the secret,
+        best first. Hosts are estimated in batches and the ones too small for
+        the secret are left out."""
+        estimates = [self.estimate(secret, slice(i, i + batch))
+                     for i in range(0, len(self.paths), batch)]
+        psnr, k, direction = (np.concatenate(e) for e in zip(*estimates))
+
+        order = np.argsort(-psnr)[:top]
+        order = order[np.isfinite(psnr[order])]
+        return [(self.paths[i], psnr[i], k[i], direction[i]) for i in order]
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='summarize host images')
+    build.add_argument('-i', '--index', required=True)
+    build.add_argument('hosts', nargs='+')
+
+    query = sub.add_parser('query', help='rank the hosts for a secret')
+    query.add_argument('-i', '--index', required=True)
+    query.add_argument('-s', '--secret', required=True)
+    query.add_argument('-k', '--top', default=10, type=int)
+    query.add_argument('-r', '--raw', action='store_true',
+                       help='read the secret file as raw bytes')
+
+    args = vars(ap.parse_args())
+
+    if args['command'] == 'build':
+        HostIndex.build(args['index'], args['hosts'])
+        return
+
+    if args['raw']:
+        secret = np.fromfile(args['secret'], dtype=np.uint8)
+    else:
+        secret = np.array(Image.open(args['secret']).convert('L'))
+
+    index = HostIndex(args['index'])
+    for path, psnr, k, direction in index.rank(secret, args['top']):
+        print('{:8.4f}  k={}  {:12}  {}'.format(
+            psnr, k, MatScanner.Direction(direction).name, path))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+# File locks are only available on Unix
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class LogStore:
+    """Columnar store of the per generation statistics of many GA runs.
+
+    Every logbook column (gen, nevals, avg, std, min, max...) is appended to
+    its own file of float64 values, shared by all the runs. A run is only
+    visible once its line is written to the index, after its columns.
+    Reading memory-maps the requested column files, so the statistics of
+    thousands of runs are loaded in one pass without unpickling populations.
+
+    Files in the store directory:
+    	index.jsonl: one line per run with its id, parameters and the offset
+    	             and shape of every column
+    	<column>.f8: float64 values of the column for every run
+    	lock: file locked while a run is written
+
+    Several processes can write to the same store: every write holds an
+    exclusive lock, so the column offsets and the index lines of the runs
+    never interleave. Without fcntl (Windows) the store must have a single
+    writer, like sweep.py.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _column(self, name):
+        return os.path.join(self.path, name + '.f8')
+
+    def runs(self):
+        """Returns the index entries of the stored runs"""
+        index = os.path.join(self.path, 'index.jsonl')
+        if not os.path.exists(index):
+            return []
+
+        with open(index) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def __contains__(self, run_id):
+        return any(run['run_id'] == run_id for run in self.runs())
+
+    def write(self, run_id, logbook, **params):
+        """Appends the columns of a DEAP logbook
+
+        Args:
+        	run_id: unique name of the run
+        	logbook: deap.tools.Logbook of the run
+        	params: JSON serializable run parameters, used to select runs
+        """
+        with open(os.path.join(self.path, 'lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+
+            columns = dict()
+            for name in logbook.header:
+                values = np.asarray(logbook.select(name), dtype=np.float64)
+
+                with open(self._column(name), 'ab') as f:
+                    offset = f.tell() // values.itemsize
+                    values.tofile(f)
+
+                columns[name] = [offset, list(values.shape)]
+
+            entry = {'run_id' : run_id, 'params' : params,
+                     'columns' : columns}
+            with open(os.path.join(self.path, 'index.jsonl'), 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def select(self, columns, run_ids=None, **params):
+        """Loads the columns of the runs matching the run ids and parameters
+
+        Args:
+        	columns: names of the columns to load
+        	run_ids: optional list of run ids, in the order they are returned.
+        	         The ones not in the store are skipped.
+        	params: parameter values the runs must have
+
+        Return:
+        	(runs, data): the index entries of the selected runs and a dict
+        	mapping every column to the list of its arrays, one per run. Runs
+        	without a column get None.
+        """
+        runs = self.runs()
+        if run_ids is not None:
+            by_id = {run['run_id'] : run for run in runs}
+            runs = [by_id[run_id] for run_id in run_ids if run_id in by_id]
+
+        runs = [run for run in runs
+                if all(run['params'].get(k) == v for k, v in params.items())]
+
+        data = dict()
+        for name in columns:
+            path = self._column(name)
+            values = (np.memmap(path, dtype=np.float64, mode='r')
+                      if os.path.exists(path) else None)
+
+            data[name] = list()
+            for run in runs:
+                if name not in run['columns']:
+                    data[name].append(None)
+                    continue
+
+                offset, shape = run['columns'][name]
+                size = int(np.prod(shape))
+                data[name].append(
+                    np.array(values[offset : offset + size]).reshape(shape))
+
+        return runs, data
+
+def load_pickle(path):
+    """Loads a result pickle written with sklearn.externals.joblib. joblib is
+    only needed by this converter, so it is imported here."""
+    import joblib
+    import joblib.numpy_pickle
+    import genstego
+
+    # The pickles reference the joblib module vendored by old sklearn
+    # versions
+    for name in ('sklearn', 'sklearn.externals'):
+        sys.modules.setdefault(name, type(sys)(name))
+    sys.modules.setdefault('sklearn.externals.joblib', joblib)
+    sys.modules.setdefault('sklearn.externals.joblib.numpy_pickle',
+                           joblib.numpy_pickle)
+
+    # The populations are creator.Individual instances
+    genstego.setup_deap_individuals()
+
+    return joblib.load(path)
+
+def convert(store, paths):
+    """Appends the logbooks of result pickles to the store. The run id is the
+    file name without extension."""
+    for path in paths:
+        run_id = os.path.splitext(os.path.basename(path))[0]
+        if run_id in store:
+            continue
+
+        result = load_pickle(path)
+        params = {
+            'host_shape' : list(result['host'].shape),
+            'secret_shape' : list(result['secret'].shape),
+            'fitness' : float(result['hof'].items[0].fitness.values[0])
+        }
+        store.write(run_id, result['logbook'], **params)
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    conv = sub.add_parser('convert', help='import joblib result pickles')
+    conv.add_argument('-l', '--log-store', required=True)
+    conv.add_argument('pickles', nargs='+')
+
+    ls = sub.add_parser('list', help='list the stored runs')
+    ls.add_argument('-l', '--log-store', required=True)
+
+    args = vars(ap.parse_args())
+    store = LogStore(args['log_store'])
+
+    if args['command'] == 'convert':
+        convert(store, args['pickles'])
+        return
+
+    for run in store.runs():
+        print('{:30} {}'.format(run['run_id'], json.dumps(run['params'])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+import genstego
+import helper_individual
+
+from PIL import Image
+from deap import creator, tools
+from context import HostContext
+from scanner import MatScanner
+
+def downsample(img, factor):
+    """Mean of every factor x factor block of the image. Rows and columns
+    not filling a whole block are dropped."""
+    height, width = img.shape[0] // factor, img.shape[1] // factor
+    blocks = img[:height * factor, :width * factor].reshape(height, factor,
+                                                            width, factor)
+    return np.round(blocks.mean((1, 3))).astype(np.uint8)
+
+def scale_secret(secret, factor):
+    """Scale the secret message by 1/factor in every dimension. Byte payloads
+    are truncated to 1/factor**2 of their length."""
+    if secret.ndim == 2:
+        height = max(1, secret.shape[0] // factor)
+        width = max(1, secret.shape[1] // factor)
+        return np.array(Image.fromarray(secret).resize((width, height)))
+
+    return secret.ravel()[:max(1, secret.size // factor**2)]
+
+def default_factor(shape, side=256):
+    """Smallest factor making the longest side of the host fit in side
+    pixels, the range of the 8 bits offset genes"""
+    return max(1, math.ceil(max(shape) / side))
+
+def upscale_chromosome(chromosome, factor, small_shape, shape):
+    """Map a chromosome found on the downsampled host to the full resolution
+    host. Returns a base 10 chromosome with the offsets scaled by factor.
+
+    Offset genes past the downsampled shape carry into the next row (or
+    column for the column orders), so they are first replaced by the pixel
+    the sequence starts at, which is the (y, x) of the normalized genes."""
+    if len(chromosome) > 7:
+        chromosome = helper_individual.packchromosome(chromosome)
+
+    chromosome = np.array(chromosome, dtype=np.int64)
+    first = MatScanner.positions_genetic(small_shape, chromosome, 0, 1)[0]
+    y, x = divmod(int(first), small_shape[1])
+
+    chromosome[1] = x * factor % shape[1]
+    chromosome[2] = y * factor % shape[0]
+    return chromosome
+
+def refine(context, secret, candidates, budget, step):
+    """Pattern search over the offset genes of the full resolution
+    chromosomes. Neighbour offsets at distance step are evaluated and the
+    step is halved when none of them improves the best fitness.
+
+    Args:
+    	context: HostContext of the full resolution host
+    	secret: full resolution secret message
+    	candidates: base 10 chromosomes to start from
+    	budget: maximum number of fitness evaluations
+    	step: initial offset step, usually the downsampling factor
+
+    Return:
+    	(evaluated, evals): list of (chromosome, fitness) and the number of
+    	evaluations
+    """
+    height, width = context.shape
+    evaluated = [(c, genstego.fitness(c, context, secret)[0])
+                 for c in candidates[:budget]]
+    evals = len(evaluated)
+
+    best, best_fit = max(evaluated, key=lambda e: e[1])
+    while step >= 1 and evals < budget:
+        improved = False
+        for dx, dy in ((step, 0), (-step, 0), (0, step), (0, -step)):
+            if evals >= budget:
+                break
+
+            c = best.copy()
+            c[1] = (c[1] + dx) % width
+            c[2] = (c[2] + dy) % height
+
+            fit = genstego.fitness(c, context, secret)[0]
+            evaluated.append((c, fit))
+            evals += 1
+
+            if fit > best_fit:
+                best, best_fit, improved = c, fit, True
+
+        if not improved:
+            step //= 2
+
+    return evaluated, evals
+
+def evolve_multires(host, secret, factor=None, ngen=80, npop=100, cxpb=0.7,
+                    mutpb=0.25, seed=None, budget=50, verbose=__debug__):
+    """Coarse to fine search. The GA runs on the downsampled host with a
+    proportionally scaled secret, its hall of fame is mapped to the full
+    resolution and refined there with at most budget evaluations.
+
+    The full resolution chromosomes are base 10 int64 arrays
+    (upscale_chromosome), as their offset genes may not fit in 8 bits. They
+    cannot be converted back to base 2 with helper_individual.c_rep.
+
+    Args:
+    	host: host image
+    	secret: secret message
+    	factor: downsampling factor, default_factor by default
+    	budget: number of full resolution evaluations
+
+    Return:
+    	(population, logbook, halloffame): the population and logbook of the
+    	downsampled search and the hall of fame at full resolution
+    """
+    if factor is None:
+        factor = default_factor(host.shape)
+
+    small_host = downsample(host, factor)
+    small_secret = scale_secret(np.asarray(secret), factor)
+
+    pop, logbook, small_hof = genstego.evolve(small_host, [small_secret], ngen,
+                                              npop, cxpb, mutpb, seed=seed,
+                                              verbose=verbose)
+
+    candidates = [upscale_chromosome(c, factor, small_host.shape, host.shape)
+                  for c in small_hof.items]
+    evaluated, evals = refine(HostContext(host), secret, candidates, budget,
+                              factor)
+
+    hof = tools.HallOfFame(len(small_hof.items), similar=np.array_equal)
+    individuals = list()
+    for c, fit in evaluated:
+        ind = creator.Individual(c)
+        ind.fitness.values = (fit,)
+        individuals.append(ind)
+    hof.update(individuals)
+
+    return pop, logbook, hof
@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import os
+import threading
+import numpy as np
+import genstego
+import helper_individual
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+def load_image(path):
+    """Reads an image file as a grayscale array"""
+    return np.array(Image.open(path).convert('L'))
+
+def save_image(path, image):
+    """Writes an array as an image file, the format given by its extension"""
+    Image.fromarray(image).save(path)
+
+class Prefetcher:
+    """Iterates over (path, image) of a list of files, loading the next ones
+    on a thread pool while the current one is processed. Pillow releases the
+    GIL while decoding, so decompression overlaps with the computation.
+
+    At most depth images are loaded ahead of the consumer, which bounds the
+    memory used when the computation is slower than the reads.
+    """
+
+    def __init__(self, paths, load=load_image, workers=2, depth=4):
+        self.paths = paths
+        self.load = load
+        self.workers = workers
+        self.depth = depth
+
+    def __iter__(self):
+        paths = iter(self.paths)
+        pool = ThreadPoolExecutor(self.workers)
+        try:
+            pending = deque((path, pool.submit(self.load, path))
+                            for path in itertools.islice(paths, self.depth))
+            while pending:
+                path, future = pending.popleft()
+                image = future.result()
+
+                # Refill the slot taken by the consumer
+                for path_next in itertools.islice(paths, 1):
+                    pending.append((path_next,
+                                    pool.submit(self.load, path_next)))
+
+                yield path, image
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+class Writer:
+    """Writes images on a thread pool in the background. submit blocks while
+    depth images are waiting to be written (backpressure), and close waits
+    for the pending ones. Errors of the writes are raised by submit or
+    close."""
+
+    def __init__(self, save=save_image, workers=2, depth=4):
+        self.save = save
+        self._pool = ThreadPoolExecutor(workers)
+        self._slots = threading.BoundedSemaphore(depth)
+        self._futures = list()
+
+    def _check(self):
+        """Raise the error of the finished writes, if any"""
+        done = [f for f in self._futures if f.done()]
+        self._futures = [f for f in self._futures if not f.done()]
+        for future in done:
+            future.result()
+
+    def submit(self, path, image):
+        self._check()
+        self._slots.acquire()
+
+        future = self._pool.submit(self.save, path, image)
+        future.add_done_callback(lambda f: self._slots.release())
+        self._futures.append(future)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _output(outdir, path, suffix):
+    """Output path of an input file. Stego and decoded images are always PNG,
+    a lossy format would destroy the embedded bits."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(outdir, name + suffix + '.png')
+
+def embed_all(hosts, secret, outdir, ngen=80, npop=100, cxpb=0.7, mutpb=0.25,
+              seed=None, workers=2, depth=4):
+    """Hide the secret into every host. The next hosts are loaded and the
+    previous stego images written while the GA runs on the current host.
+
+    Args:
+    	hosts: host image paths
+    	secret: secret message
+    	outdir: directory receiving the <host>-stego.png images
+
+    Return:
+    	generator: (host path, base 10 chromosome, fitness) of every host
+    """
+    os.makedirs(outdir, exist_ok=True)
+
+    with Writer(workers=workers, depth=depth) as writer:
+        for path, host in Prefetcher(hosts, workers=workers, depth=depth):
+            _, _, hof = genstego.evolve(host, [secret], ngen, npop, cxpb,
+                                        mutpb, seed=seed, verbose=False)
+            best = hof.items[0]
+
+            writer.submit(_output(outdir, path, '-stego'),
+                          genstego.embed(host, secret, best))
+            yield (path, helper_individual.packchromosome(best),
+                   best.fitness.values[0])
+
+def decode_all(stegos, s_shape, chromosome, outdir, workers=2, depth=4):
+    """Decode the secret message of every stego image with the same
+    chromosome, overlapping the reads and writes with the decoding.
+
+    Return:
+    	generator: path of every decoded <stego>-secret.png image
+    """
+    os.makedirs(outdir, exist_ok=True)
+
+    with Writer(workers=workers, depth=depth) as writer:
+        for path, stego in Prefetcher(stegos, workers=workers, depth=depth):
+            out = _output(outdir, path, '-secret')
+            writer.submit(out, genstego.decode(stego, s_shape, chromosome))
+            yield out
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest='command', required=True)
+
+    emb = sub.add_parser('embed', help='hide a secret into every host')
+    emb.add_argument('-s', '--secret', required=True)
+    emb.add_argument('-o', '--output', required=True)
+    emb.add_argument('-g', '--generations', default=80, type=int)
+    emb.add_argument('-p', '--population', default=100, type=int)
+    emb.add_argument('-c', '--crossover', default=0.7, type=float)
+    emb.add_argument('-m', '--mutation', default=0.25, type=float)
+    emb.add_argument('--seed', type=int)
+    emb.add_argument('hosts', nargs='+')
+
+    dec = sub.add_parser('decode', help='decode every stego image')
+    dec.add_argument('-o', '--output', required=True)
+    dec.add_argument('--shape', required=True, nargs=2, type=int,
+                     help='secret image height and width')
+    dec.add_argument('--chromosome', required=True, nargs=7, type=int,
+                     help='base 10 chromosome printed by embed')
+    dec.add_argument('stegos', nargs='+')
+
+    for p in (emb, dec):
+        p.add_argument('-w', '--workers', default=2, type=int,
+                       help='I/O threads')
+        p.add_argument('-d', '--depth', default=4, type=int,
+                       help='images loaded ahead or waiting to be written')
+
+    args = vars(ap.parse_args())
+
+    if args['command'] == 'embed':
+        secret = load_image(args['secret'])
+        results = embed_all(args['hosts'], secret, args['output'],
+                            args['generations'], args['population'],
+                            args['crossover'], args['mutation'], args['seed'],
+                            args['workers'], args['depth'])
+        for path, chromosome, fit in results:
+            print('{:30} {:8.4f}  {}'.format(path, fit,
+                                            ' '.join(map(str, chromosome))))
+        return
+
+    decoded = decode_all(args['stegos'], tuple(args['shape']),
+                         np.array(args['chromosome']), args['output'],
+                         args['workers'], args['depth'])
+    for path in decoded:
+        print(path)
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
-from sklearn.externals import joblib
 from matplotlib import pyplot as plt
+from logstore import LogStore
 
 import argparse
 
@@ -22,25 +22,25 @@ def plot_avg(ax, gen, fit_avg, color, label):
 
 ap = argparse.ArgumentParser()
 
-ap.add_argument('-t', '--tests', required=True, nargs=3)
+ap.add_argument('-l', '--log-store', required=True)
+ap.add_argument('-t', '--tests', required=True, nargs='+',
+                help='run ids of the log store')
 
 args = vars(ap.parse_args())
 
-colors = ['b-', 'g-', 'r-']
-labels = ['Baboon', 'Jet', 'Pepper']
-gen = list()
-fit_max = list()
-fit_std = list()
-fit_avg = list()
+colors = ['b-', 'g-', 'r-', 'c-', 'm-', 'y-', 'k-']
 
-for t in args['tests']:
-    pkl = joblib.load(t)
-    lb = pkl['logbook']
+# Only the plotted columns are read from the store
+store = LogStore(args['log_store'])
+runs, data = store.select(['gen', 'max', 'std', 'avg'], args['tests'])
+labels = [r['run_id'] for r in runs]
 
-    gen.append(lb.select('gen'))
-    fit_max.append(lb.select('max'))
-    fit_std.append(lb.select('std'))
-    fit_avg.append(lb.select('avg'))
+missing = [t for t in args['tests'] if t not in labels]
+if missing:
+    ap.error('runs not in the log store: ' + ' '.join(missing))
+
+gen, fit_max = data['gen'], data['max']
+fit_std, fit_avg = data['std'], data['avg']
 
 (figure, axes) = plt.subplots(1, 3)
 
@@ -51,7 +51,7 @@ axes[2].set_title('Std individuals')
 for ax in axes:
     configure_axis(ax)
 
-for (c, l, g, fmax, fstd, favg) in zip(colors, labels, gen, fit_max, fit_std, fit_avg):
+for (c, l, g, fmax, fstd, favg) in zip(colors * len(labels), labels, gen, fit_max, fit_std, fit_avg):
     plot_max(axes[0], g, fmax, c, l)
     plot_avg(axes[1], g, favg, c, l)
     plot_std(axes[2], g, fstd, c, l)
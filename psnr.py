@@ -12,6 +12,10 @@ def psnr(img1, img2):
     
     mse = np.mean((img1 - img2)**2)
 
+    return psnr_mse(mse)
+
+def psnr_mse(mse):
+    """Computes psnr fitness function from the mean squared error"""
     if mse == 0:
         return 100
     return 10 * math.log10(255 / mse)
@@ -403,7 +403,163 @@ class MatScanner:
         Return:
         	numpy.array
         """
-        return cls.scan(img, chromosome[2], chromosome[1], chromosome[0])
+        return cls.scan(img, int(chromosome[2]), int(chromosome[1]),
+                        chromosome[0])
+
+    @classmethod
+    def _base_positions(cls, i, shape, y, x, direction):
+        """Returns the flattened positions of the scan elements i for the 8
+        first directions"""
+        h, w = shape
+        n = h * w
+
+        if direction == cls.Direction.raster:
+            return (i + y * w + x) % n
+        elif direction == cls.Direction.left_up:
+            return (n - 1 - i + y * w + x + 1) % n
+
+        # Offset of the rolled sequence and flattening of the flipped matrix
+        if direction == cls.Direction.left_down:
+            j = (i + y * w + w - 1 - x) % n
+            return j // w * w + w - 1 - j % w
+        elif direction == cls.Direction.right_up:
+            j = (i + (h - y - 1) * w + x) % n
+            return (h - 1 - j // w) * w + j % w
+        elif direction == cls.Direction.down_right:
+            j = (i + x * h + y) % n
+            return j % h * w + j // h
+        elif direction == cls.Direction.down_left:
+            j = (i + (w - x - 1) * h + y) % n
+            return j % h * w + w - 1 - j // h
+        elif direction == cls.Direction.up_right:
+            j = (i + x * h + h - y - 1) % n
+            return (h - 1 - j % h) * w + j // h
+        elif direction == cls.Direction.up_left:
+            j = (i + (w - x - 1) * h + h - y - 1) % n
+            return (h - 1 - j % h) * w + w - 1 - j // h
+
+    @classmethod
+    def _offset(cls, shape, y, x, direction):
+        """Returns s such that the scan element i starting at (y, x) is the
+        element i + s starting at (0, 0), for the 8 first directions"""
+        h, w = shape
+
+        offsets = {
+            cls.Direction.raster : y * w + x,
+            cls.Direction.left_up : -(y * w + x),
+            cls.Direction.left_down : y * w - x,
+            cls.Direction.right_up : x - y * w,
+            cls.Direction.down_right : x * h + y,
+            cls.Direction.down_left : y - x * h,
+            cls.Direction.up_right : x * h - y,
+            cls.Direction.up_left : -x * h - y
+        }
+        return offsets[direction] % (h * w)
+
+    @classmethod
+    def shift(cls, shape, y, x, direction):
+        """Relates the sequence starting at (y, x) to the one starting at
+        (0, 0), so the positions of every offset come from a single order:
+
+        >>> p = MatScanner.positions(shape, 0, 0, d)
+        >>> s, dy, dx = MatScanner.shift(shape, y, x, d)
+        >>> MatScanner.roll_positions(np.roll(p, -s), shape, dy, dx)
+        equals MatScanner.positions(shape, y, x, d)
+
+        The 8 first directions start elsewhere in the same cycle (dy = dx =
+        0). The no row-jump orders also roll the rows by dy, and the no
+        column-jump ones the columns by dx, because _zig_zag flips the rows or
+        columns of the matrix before it is rolled.
+
+        Return:
+        	(s, dy, dx)
+        """
+        direction = cls.Direction(direction)
+        y, x = int(y), int(x)
+
+        if direction.value < 8:
+            return cls._offset(shape, y, x, direction), 0, 0
+
+        base = cls.Direction(direction.value - 8)
+        if direction in (cls.Direction.z_raster, cls.Direction.z_left_down,
+                         cls.Direction.z_right_up, cls.Direction.z_left_up):
+            return cls._offset(shape, 0, x, base), y % shape[0], 0
+
+        return cls._offset(shape, y, 0, base), 0, x % shape[1]
+
+    @staticmethod
+    def roll_positions(p, shape, dy, dx):
+        """Returns the flattened positions p with the rows rolled by dy and
+        the columns by dx"""
+        h, w = shape
+        if dy:
+            p = (p + dy * w) % (h * w)
+        if dx:
+            p = p - p % w + (p % w + dx) % w
+        return p
+
+    @classmethod
+    def positions(cls, shape, y, x, direction, start=0, stop=None):
+        """Returns the flattened (C order) positions of the elements
+        start:stop of the pixel sequence, without scanning the image:
+
+        >>> img.ravel()[MatScanner.positions(img.shape, y, x, d)]
+        equals MatScanner.scan(img, y, x, d)
+
+        Args:
+        	shape: matrix shape
+        	y: starting row
+        	x: starting column
+        	direction: scan direction
+        	start: first element of the sequence
+        	stop: end of the sequence, the whole matrix by default
+
+        Return:
+        	numpy.array
+        """
+        direction = cls.Direction(direction)
+        h, w = shape
+        y, x = int(y), int(x)
+
+        if stop is None:
+            stop = h * w
+
+        i = np.arange(start, stop, dtype=np.int64)
+
+        if direction.value < 8:
+            return cls._base_positions(i, shape, y, x, direction)
+
+        # No row-jump or column-jump orders scan the rolled and zig-zagged
+        # matrix with the matching first directions
+        base = cls.Direction(direction.value - 8)
+        inverse = direction in (cls.Direction.z_right_up,
+                                cls.Direction.z_left_up,
+                                cls.Direction.z_down_left,
+                                cls.Direction.z_up_left)
+
+        if direction in (cls.Direction.z_raster, cls.Direction.z_left_down,
+                         cls.Direction.z_right_up, cls.Direction.z_left_up):
+            p = cls._base_positions(i, shape, 0, x, base)
+            r, c = p // w, p % w
+
+            # _zig_zag never flips the first row
+            parity = 0 if inverse and h % 2 == 1 else 1
+            flip = (r % 2 == parity) & (r > 0)
+            return (r + y) % h * w + np.where(flip, w - 1 - c, c)
+
+        p = cls._base_positions(i, shape, y, 0, base)
+        r, c = p // w, p % w
+
+        parity = 0 if inverse and w % 2 == 1 else 1
+        flip = (c % 2 == parity) & (c > 0)
+        return np.where(flip, h - 1 - r, r) * w + (c + x) % w
+
+    @classmethod
+    def positions_genetic(cls, shape, chromosome, start=0, stop=None):
+        """Returns the flattened positions of the elements start:stop of the
+        pixel sequence given by the provided chromosome"""
+        return cls.positions(shape, chromosome[2], chromosome[1],
+                             chromosome[0], start, stop)
 
     @classmethod
     def reshape(cls, img, shape, y, x, direction):
@@ -459,7 +615,8 @@ class MatScanner:
         Return:
         	numpy.array
         """
-        return cls.reshape(img, shape, chromosome[2], chromosome[1], chromosome[0])
+        return cls.reshape(img, shape, int(chromosome[2]), int(chromosome[1]),
+                           chromosome[0])
 
 if __name__ == '__main__':
     mat = np.arange(10).reshape(2,5)
@@ -564,3 +721,30 @@ if __name__ == '__main__':
     mat_reshaped = MatScanner.reshape(mat_scanned, mat.shape, 1, 1,
                                       MatScanner.Direction.z_up_left)
     print('- Original: \n{}'.format(mat_reshaped))
+
+    # The closed form positions must match the scans, and the sequence of
+    # every offset must be a rotation of the (0, 0) one (MatScanner.shift)
+    for shape in [(2, 5), (3, 3), (4, 6), (5, 4), (7, 7), (1, 4)]:
+        mat = np.arange(shape[0] * shape[1]).reshape(shape)
+        size = mat.size
+
+        for direction in MatScanner.Direction:
+            p0 = MatScanner.positions(shape, 0, 0, direction)
+            for y in range(shape[0] + 2):
+                for x in range(shape[1] + 2):
+                    p = MatScanner.positions(shape, y, x, direction)
+                    scanned = MatScanner.scan(mat, y, x, direction)
+                    assert (mat.ravel()[p] == scanned).all(), \
+                        (shape, direction, y, x)
+
+                    s, dy, dx = MatScanner.shift(shape, y, x, direction)
+                    rotated = MatScanner.roll_positions(np.roll(p0, -s),
+                                                        shape, dy, dx)
+                    assert (rotated == p).all(), (shape, direction, y, x)
+
+                    start, stop = size // 3, size - size // 4
+                    assert (MatScanner.positions(shape, y, x, direction,
+                                                 start, stop)
+                            == p[start:stop]).all(), (shape, direction, y, x)
+
+    print('\n- Positions: checked against the scans')
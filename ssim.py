@@ -0,0 +1,105 @@
+import numpy as np
+
+from psnr import psnr_mse
+
+# Stabilization constants for a dynamic range of 255
+C1 = (0.01 * 255)**2
+C2 = (0.03 * 255)**2
+
+def box_filter(img, win=7):
+    """Mean of every win x win window of the image (valid windows only),
+    computed with an integral image"""
+    integral = np.zeros((img.shape[0] + 1, img.shape[1] + 1))
+    np.cumsum(np.cumsum(img, 0), 1, out=integral[1:, 1:])
+
+    return (integral[win:, win:] - integral[:-win, win:]
+            - integral[win:, :-win] + integral[:-win, :-win]) / win**2
+
+def host_stats(host, win=7):
+    """Window means and variances of the host, shared by every evaluation"""
+    host = host.astype(np.float64)
+    mu = box_filter(host, win)
+    var = box_filter(host * host, win) - mu * mu
+
+    return mu, var
+
+def _ssim_map(mu_x, var_x, mu_y, var_y, cov):
+    return (((2 * mu_x * mu_y + C1) * (2 * cov + C2))
+            / ((mu_x**2 + mu_y**2 + C1) * (var_x + var_y + C2)))
+
+def ssim(img1, img2, win=7):
+    """Computes the mean SSIM of two images with a uniform win x win window"""
+    img1 = img1.astype(np.float64)
+    img2 = img2.astype(np.float64)
+
+    mu_x, mu_y = box_filter(img1, win), box_filter(img2, win)
+    var_x = box_filter(img1 * img1, win) - mu_x**2
+    var_y = box_filter(img2 * img2, win) - mu_y**2
+    cov = box_filter(img1 * img2, win) - mu_x * mu_y
+
+    return _ssim_map(mu_x, var_x, mu_y, var_y, cov).mean()
+
+def _bounds(changed, length, win):
+    """Returns the range of windows containing any changed row or column"""
+    idx = np.flatnonzero(changed)
+    return max(0, idx[0] - win + 1), min(length - win + 1, idx[-1] + 1)
+
+def psnr_ssim(host, stego, stats=None, win=7):
+    """Computes psnr and SSIM in a single pass over the difference between the
+    stego and the host images.
+
+    The host window statistics (host_stats) are computed once and reused, and
+    the stego ones are expanded from the windowed sums of the difference, so
+    only three windowed sums are computed per evaluation. The squared
+    difference buffer gives the mean squared error of psnr too. Windows
+    without changed pixels have an SSIM of 1, so only the bounding box of the
+    changes is filtered.
+
+    Args:
+    	host: host image
+    	stego: stego image
+    	stats: host_stats(host, win), computed when not given
+    	win: SSIM window size
+
+    Return:
+    	(psnr, ssim)
+    """
+    if stats is None:
+        stats = host_stats(host, win)
+
+    d = stego.astype(np.float64)
+    d -= host
+    changed = d != 0
+
+    rows = changed.any(1)
+    if not rows.any():
+        return psnr_mse(0), 1.0
+
+    # Windows touched by the changes
+    r0, r1 = _bounds(rows, d.shape[0], win)
+    c0, c1 = _bounds(changed.any(0), d.shape[1], win)
+    mu_x, var_x = (s[r0:r1, c0:c1] for s in stats)
+
+    x = host[r0 : r1 + win - 1, c0 : c1 + win - 1].astype(np.float64)
+    d2 = d[r0 : r1 + win - 1, c0 : c1 + win - 1]
+
+    # Windowed sums of the difference
+    mu_d = box_filter(d2, win)
+    x *= d2
+    xd = box_filter(x, win)
+    d *= d
+    dd = box_filter(d2, win)
+
+    mse = d.mean()
+
+    # Stego statistics expanded from stego = host + difference
+    mu_y = mu_x + mu_d
+    xd -= mu_x * mu_d
+    cov = var_x + xd
+    var_y = cov + xd + dd - mu_d * mu_d
+
+    windows = (d.shape[0] - win + 1) * (d.shape[1] - win + 1)
+    unchanged = windows - mu_x.size
+    total = _ssim_map(mu_x, var_x, mu_y, var_y, cov).sum() + unchanged
+
+    return psnr_mse(mse), total / windows
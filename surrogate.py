@@ -0,0 +1,203 @@
+import numpy as np
+
+from abc import ABC, abstractmethod
+from functools import partial
+from deap import algorithms, tools
+
+class Surrogate(ABC):
+    """Cheap fitness model trained online from the evaluated individuals.
+
+    Individuals are the base 2 chromosomes. The model only keeps the last
+    `memory` evaluated individuals.
+    """
+
+    def __init__(self, memory=2000):
+        self.memory = memory
+        self.X = np.empty((0, 0), dtype=np.uint8)
+        self.y = np.empty(0)
+
+    def update(self, individuals):
+        """Add the evaluated individuals to the training set and refit"""
+        if len(individuals) == 0:
+            return
+
+        X = np.array([np.asarray(ind) for ind in individuals], dtype=np.uint8)
+        y = np.array([ind.fitness.values[0] for ind in individuals])
+
+        if len(self.y) > 0:
+            X = np.vstack((self.X, X))
+            y = np.concatenate((self.y, y))
+
+        self.X, self.y = X[-self.memory:], y[-self.memory:]
+        self._fit()
+
+    @abstractmethod
+    def _fit(self):
+        """Refit the model to the training set X, y"""
+
+    @abstractmethod
+    def predict(self, individuals):
+        """Returns the predicted fitness of the individuals"""
+
+
+class AdditiveSurrogate(Surrogate):
+    """Per-gene additive model. The fitness is approximated by a ridge
+    regression over the chromosome bits."""
+
+    def __init__(self, alpha=1.0, memory=2000):
+        super().__init__(memory)
+        self.alpha = alpha
+        self.w = None
+
+    def _fit(self):
+        X = np.hstack((np.ones((len(self.X), 1)), self.X))
+        A = X.T @ X + self.alpha * np.eye(X.shape[1])
+        self.w = np.linalg.solve(A, X.T @ self.y)
+
+    def predict(self, individuals):
+        X = np.array([np.asarray(ind) for ind in individuals], dtype=float)
+        return self.w[0] + X @ self.w[1:]
+
+
+class KNNSurrogate(Surrogate):
+    """k-Nearest Neighbours model. The fitness is the mean fitness of the k
+    evaluated chromosomes with the lowest Hamming distance."""
+
+    # Number of set bits of every byte
+    _popcount = np.unpackbits(np.arange(256, dtype=np.uint8)
+                              .reshape(-1, 1), 1).sum(1)
+
+    def __init__(self, k=5, memory=2000):
+        super().__init__(memory)
+        self.k = k
+        self.packed = None
+
+    def _fit(self):
+        self.packed = np.packbits(self.X, 1)
+
+    def predict(self, individuals):
+        X = np.packbits([np.asarray(ind) for ind in individuals], 1)
+
+        # Hamming distances [individuals, training set]
+        dist = self._popcount[X[:, None, :] ^ self.packed[None, :, :]].sum(2)
+
+        k = min(self.k, len(self.y))
+        nearest = np.argpartition(dist, k - 1, 1)[:, :k]
+        return self.y[nearest].mean(1)
+
+
+def _spearman(x, y):
+    """Spearman rank correlation of two sequences"""
+    if len(x) < 2:
+        return np.nan
+
+    rx = np.argsort(np.argsort(x))
+    ry = np.argsort(np.argsort(y))
+    if rx.std() == 0 or ry.std() == 0:
+        return np.nan
+
+    return np.corrcoef(rx, ry)[0, 1]
+
+def eaSurrogate(population, toolbox, cxpb, mutpb, ngen, surrogate, screen=0.25,
+                stats=None, halloffame=None, verbose=__debug__):
+    """Surrogate-assisted version of algorithms.eaSimple. Every generation the
+    surrogate ranks the offspring and only the best `screen` fraction gets the
+    real fitness. The rest keep the predicted fitness for the selection and are
+    ranked again in the following generations until they are evaluated or
+    discarded. The statistics only cover the individuals with a real fitness,
+    and the predicted fitnesses are removed from the returned population. Like
+    genstego.eaSimple, the offspring are produced by toolbox.vary when it is
+    registered.
+
+    The logbook records the number of real evaluations and the accuracy of the
+    surrogate over them: the Spearman rank correlation (sr_rho) and the mean
+    absolute error (sr_mae) between the predicted and the real fitness.
+
+    Args:
+    	population: list of individuals
+    	toolbox: deap toolbox with the evaluate, mate, mutate and select
+    	cxpb: crossover probability
+    	mutpb: mutation probability
+    	ngen: number of generations
+    	surrogate: Surrogate model
+    	screen: fraction of the candidates evaluated with the real fitness
+
+    Return:
+    	(population, logbook)
+    """
+    vary = getattr(toolbox, 'vary', None) or partial(algorithms.varAnd,
+                                                     toolbox=toolbox)
+
+    logbook = tools.Logbook()
+    logbook.header = (['gen', 'nevals', 'sr_rho', 'sr_mae']
+                      + (stats.fields if stats else []))
+
+    # Evaluate the individuals with an invalid fitness
+    invalid_ind = [ind for ind in population if not ind.fitness.valid]
+    fitnesses = toolbox.map(toolbox.evaluate, invalid_ind)
+    for ind, fit in zip(invalid_ind, fitnesses):
+        ind.fitness.values = fit
+        ind.predicted = False
+
+    surrogate.update(invalid_ind)
+
+    if halloffame is not None:
+        halloffame.update(population)
+
+    record = stats.compile(population) if stats else {}
+    logbook.record(gen=0, nevals=len(invalid_ind), sr_rho=np.nan,
+                   sr_mae=np.nan, **record)
+    if verbose:
+        print(logbook.stream)
+
+    for gen in range(1, ngen + 1):
+        offspring = toolbox.select(population, len(population))
+        offspring = vary(offspring, cxpb=cxpb, mutpb=mutpb)
+
+        # Rank the individuals without a real fitness with the surrogate
+        candidates = [ind for ind in offspring
+                      if not ind.fitness.valid or getattr(ind, 'predicted', True)]
+
+        evaluated = list()
+        rho = mae = np.nan
+        if candidates:
+            weight = candidates[0].fitness.weights[0]
+            predicted = surrogate.predict(candidates)
+            order = np.argsort(-weight * predicted)
+            nevals = max(1, int(round(screen * len(candidates))))
+
+            for i in order[nevals:]:
+                candidates[i].fitness.values = (predicted[i],)
+                candidates[i].predicted = True
+
+            evaluated = [candidates[i] for i in order[:nevals]]
+            fitnesses = toolbox.map(toolbox.evaluate, evaluated)
+            for ind, fit in zip(evaluated, fitnesses):
+                ind.fitness.values = fit
+                ind.predicted = False
+
+            real = np.array([ind.fitness.values[0] for ind in evaluated])
+            rho = _spearman(predicted[order[:nevals]], real)
+            mae = np.mean(np.abs(predicted[order[:nevals]] - real))
+
+            surrogate.update(evaluated)
+
+        # Only individuals with a real fitness enter the hall of fame
+        if halloffame is not None:
+            halloffame.update(evaluated)
+
+        population[:] = offspring
+
+        real_ind = [ind for ind in population if not ind.predicted]
+        record = stats.compile(real_ind) if stats and real_ind else {}
+        logbook.record(gen=gen, nevals=len(evaluated), sr_rho=rho, sr_mae=mae,
+                       **record)
+        if verbose:
+            print(logbook.stream)
+
+    # Individuals only screened by the surrogate have no real fitness
+    for ind in population:
+        if ind.predicted:
+            del ind.fitness.values
+
+    return population, logbook
@@ -0,0 +1,165 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+import numpy as np
+import genstego
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from logstore import LogStore
+
+# Parameters of a grid cell, in the order of its run id
+PARAMS = ['host', 'secret', 'size', 'population', 'generations', 'crossover',
+          'mutation', 'seed']
+
+def load_image(path):
+    return np.array(Image.open(path).convert('L'))
+
+def secret_path(secret, size):
+    """Secret image of the given size, named like img/baboon-64.ppm"""
+    return 'img/{}-{}.ppm'.format(secret, size)
+
+def run_id(cell):
+    """Name of the run of a grid cell in the log store"""
+    host = os.path.splitext(os.path.basename(cell['host']))[0]
+    return '{}-{}-{}-p{}-g{}-c{}-m{}-s{}'.format(
+        host, *(cell[p] for p in PARAMS[1:]))
+
+def grid(hosts, secrets, sizes, populations, generations, crossovers,
+         mutations, seeds):
+    """Returns every cell of the parameter grid as a dict"""
+    return [dict(zip(PARAMS, values))
+            for values in itertools.product(hosts, secrets, sizes, populations,
+                                            generations, crossovers, mutations,
+                                            seeds)]
+
+def cost(cell):
+    """Estimated cost of a cell: the number of evaluations times the pixels
+    carrying the secret of every evaluation. Cells with an unreadable
+    secret cost 0, their error is reported when they run."""
+    try:
+        secret = Image.open(secret_path(cell['secret'], cell['size']))
+    except OSError:
+        return 0
+
+    return (cell['population'] * (cell['generations'] + 1)
+            * secret.size[0] * secret.size[1])
+
+def run_cell(cell):
+    """Runs the GA of a grid cell. Executed by the worker processes.
+
+    Return:
+    	(cell, logbook, fitness, elapsed)
+    """
+    host = load_image(cell['host'])
+    secret = load_image(secret_path(cell['secret'], cell['size']))
+
+    start = time.time()
+    _, logbook, hof = genstego.evolve(host, [secret], cell['generations'],
+                                      cell['population'], cell['crossover'],
+                                      cell['mutation'], seed=cell['seed'],
+                                      verbose=False)
+
+    return cell, logbook, hof.items[0].fitness.values[0], time.time() - start
+
+def sweep(store, cells, jobs=None, verbose=True):
+    """Runs the cells missing from the store on jobs processes, longest
+    first, and writes their logbooks to the store as they finish. Returns
+    the cells that failed."""
+    done = {run['run_id'] for run in store.runs()}
+    pending = [cell for cell in cells if run_id(cell) not in done]
+
+    # Longest processing time first: the pool starts the jobs in the order
+    # they are submitted, so the short ones fill the idle workers at the end
+    pending.sort(key=cost, reverse=True)
+
+    if verbose:
+        print('{} cells, {} already done'.format(len(cells),
+                                                 len(cells) - len(pending)))
+
+    failed = list()
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(run_cell, cell) : cell for cell in pending}
+        for future in as_completed(futures):
+            # A failing cell is reported and the others are still written
+            try:
+                cell, logbook, fit, elapsed = future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                print('{:50} failed: {!r}'.format(run_id(futures[future]), e),
+                      file=sys.stderr)
+                continue
+
+            store.write(run_id(cell), logbook, fitness=fit, elapsed=elapsed,
+                        **cell)
+
+            if verbose:
+                print('{:50} {:8.4f} {:8.2f}s'.format(run_id(cell), fit,
+                                                      elapsed))
+
+    return failed
+
+def aggregate(store, cells):
+    """Best fitness (the hall of fame one) of the cells, averaged over the
+    seeds. Cells missing from the store are left out.
+
+    Return:
+    	list: (params, mean, std, runs) with params the cell parameters
+    	except the seed
+    """
+    runs, _ = store.select([], [run_id(cell) for cell in cells])
+
+    groups = dict()
+    for run in runs:
+        key = tuple(run['params'][p] for p in PARAMS[:-1])
+        groups.setdefault(key, list()).append(run['params']['fitness'])
+
+    return [(key, np.mean(fits), np.std(fits), len(fits))
+            for key, fits in groups.items()]
+
+def main():
+    ap = argparse.ArgumentParser()
+
+    ap.add_argument('-l', '--log-store', required=True)
+    ap.add_argument('-ht', '--hosts', nargs='+', default=['img/lenna-256.ppm'])
+    ap.add_argument('-s', '--secrets', nargs='+',
+                    default=['baboon', 'pepper', 'airplane'],
+                    help='secret names, read from img/<name>-<size>.ppm')
+    ap.add_argument('-z', '--sizes', nargs='+', type=int,
+                    default=[64, 81, 115, 127, 140, 162, 180])
+    ap.add_argument('-p', '--population', nargs='+', type=int, default=[100])
+    ap.add_argument('-g', '--generations', nargs='+', type=int, default=[80])
+    ap.add_argument('-c', '--crossover', nargs='+', type=float, default=[0.7])
+    ap.add_argument('-m', '--mutation', nargs='+', type=float, default=[0.25])
+    ap.add_argument('--seed', nargs='+', type=int, default=[0])
+    ap.add_argument('-j', '--jobs', type=int,
+                    help='worker processes, the number of cores by default')
+    ap.add_argument('-o', '--output', help='write the results as CSV')
+
+    args = vars(ap.parse_args())
+
+    cells = grid(args['hosts'], args['secrets'], args['sizes'],
+                 args['population'], args['generations'], args['crossover'],
+                 args['mutation'], args['seed'])
+
+    store = LogStore(args['log_store'])
+    failed = sweep(store, cells, args['jobs'])
+
+    results = aggregate(store, cells)
+    header = PARAMS[:-1] + ['mean', 'std', 'runs']
+    lines = [','.join(header)]
+    lines += [','.join(str(v) for v in key + (mean, std, n))
+              for key, mean, std, n in results]
+
+    print('\n'.join(lines))
+    if args['output']:
+        with open(args['output'], 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    if failed:
+        sys.exit('{} cells failed'.format(len(failed)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import numpy as np
+import helper_individual
+
+from functools import partial
+from embedder import Embedder
+from context import HostContext
+from psnr import psnr
+
+class HallOfFameStore:
+    """Directory keeping the hall of fame items found for every host. Each
+    host is identified by the digest of its pixels."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def digest(host):
+        """Returns the hexadecimal digest identifying the host image"""
+        h = hashlib.sha1(str(host.shape).encode())
+        h.update(np.ascontiguousarray(host, dtype=np.uint8))
+        return h.hexdigest()
+
+    def _file(self, host, npayloads):
+        name = '{}-{}.npz'.format(self.digest(host), npayloads)
+        return os.path.join(self.path, name)
+
+    def save(self, host, halloffame, npayloads=1):
+        """Stores the chromosomes of the hall of fame items. Their dtype is
+        kept, so the int64 base 10 chromosomes of multires are not truncated.
+        Those can be re-embedded by WarmStart, but only the base 2 ones seed
+        the GA (genstego.evolve).
+        """
+        items = np.array([np.asarray(ind) for ind in halloffame.items])
+        fitness = np.array([ind.fitness.values[0] for ind in halloffame.items])
+        np.savez(self._file(host, npayloads), items=items, fitness=fitness)
+
+    def load(self, host, npayloads=1):
+        """Returns the stored chromosomes of the host or None"""
+        path = self._file(host, npayloads)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            return data['items']
+
+
+class WarmStart:
+    """Re-embeds new secrets into a host using known good chromosomes.
+
+    The pixel positions of every scan direction are computed once by a
+    HostContext, so every update only writes the secret bits into a copy of
+    the host.
+    """
+
+    def __init__(self, host, items, npayloads=1):
+        self.host = host
+        self.npayloads = npayloads
+        self.chromosomes = [helper_individual.split_multichromosome(c, npayloads)
+                            for c in items]
+
+        # Positions of every stored scan direction
+        self.context = HostContext(host)
+
+    def embed(self, secrets, chromosomes):
+        """Embed the secrets with the split chromosomes of a stored item"""
+        positions = partial(self.context.positions, chromosomes[0])
+        secrets = [Embedder.as_payload(s) for s in secrets]
+        stego = np.array(self.context.flat)
+
+        if self.npayloads > 1:
+            Embedder.embed_multi(stego, secrets, chromosomes, positions)
+        else:
+            Embedder.embed_scan(stego, secrets[0], chromosomes[0], positions)
+
+        return stego.reshape(self.host.shape)
+
+    def reembed(self, secrets, threshold):
+        """Embed the secrets with the best stored item
+
+        Args:
+        	secrets: list of secret messages
+        	threshold: minimum fitness (PSNR) accepted
+
+        Return:
+        	(stego, chromosome, fitness) or None when no item reaches the
+        	threshold
+        """
+        best = None
+        for chromosomes in self.chromosomes:
+            try:
+                stego = self.embed(secrets, chromosomes)
+            except Embedder.EmbeddingError:
+                continue
+
+            fit = psnr(self.host, stego)
+            if best is None or fit > best[2]:
+                best = (stego, chromosomes, fit)
+
+        if best is None or best[2] < threshold:
+            return None
+
+        stego, chromosomes, fit = best
+        chromosome = np.concatenate([chromosomes[0][:3]]
+                                    + [c[3:] for c in chromosomes])
+        return stego, chromosome, fit